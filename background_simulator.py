@@ -1,7 +1,7 @@
 import time
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
 from typing import Dict
 from database import ConsultasDatabase
@@ -144,36 +144,44 @@ class BackgroundSimulator():
         objetivos = []
         dom_code = 'F' if dominio == 'fd' else 'C'
         
+        # Cadencia de cada dominio como (paso, resto) sobre el minuto: FD cada 10 min (minuto % 10 == 0),
+        # CONUS cada 5 min (minuto % 5 == 1). Como 60 es múltiplo de ambos pasos, la condición vale igual
+        # sobre el minuto del día y se puede avanzar directamente de un instante válido al siguiente.
+        cadencia = {'fd': (10, 0), 'conus': (5, 1)}.get(dominio)
+
         for fecha_jjj, horarios_list in query_dict.get('fechas', {}).items():
+            if cadencia is None:
+                break
+            paso, resto = cadencia
             fecha_dt = datetime.strptime(fecha_jjj, "%Y%j")
+            # Partes de fecha comunes a todos los instantes del día
+            prefijo_jjj = fecha_dt.strftime('%Y%j')
+            fecha_ymd_str = fecha_dt.strftime("%Y%m%d")
             for horario_str in horarios_list:
                 partes = horario_str.split('-')
                 inicio_str, fin_str = partes[0], partes[1] if len(partes) > 1 else partes[0]
-                
-                inicio_dt = fecha_dt.replace(hour=int(inicio_str.split(':')[0]), minute=int(inicio_str.split(':')[1]))
-                fin_dt = fecha_dt.replace(hour=int(fin_str.split(':')[0]), minute=int(fin_str.split(':')[1]))
 
-                current_dt = inicio_dt
-                while current_dt <= fin_dt:
-                    # Aplicar la cadencia correcta para cada dominio
-                    es_tiempo_fd = (dominio == 'fd' and current_dt.minute % 10 == 0)
-                    es_tiempo_conus = (dominio == 'conus' and current_dt.minute % 5 == 1)
+                inicio_h, inicio_m = inicio_str.split(':')
+                fin_h, fin_m = fin_str.split(':')
+                inicio_min = int(inicio_h) * 60 + int(inicio_m)
+                fin_min = int(fin_h) * 60 + int(fin_m)
 
-                    if es_tiempo_fd or es_tiempo_conus:
-                        # Formato: sYYYYJJJHHMM
-                        timestamp_archivo = f"s{current_dt.strftime('%Y%j%H%M')}"
-                        if nivel == 'L1b':
-                            nombre_tgz = f"ABI-{nivel.upper()}-Rad{dom_code}-M6_{sat_code}-{timestamp_archivo}.tgz"
-                        else: # L2
-                            nombre_tgz = f"ABI-L2{dom_code}-M6_{sat_code}-{timestamp_archivo}.tgz"
+                # Primer minuto >= inicio que cumple la cadencia
+                primero = inicio_min + (resto - inicio_min) % paso
+                for minuto_dia in range(primero, fin_min + 1, paso):
+                    hora, minuto = divmod(minuto_dia, 60)
+                    # Formato: sYYYYJJJHHMM
+                    timestamp_archivo = f"s{prefijo_jjj}{hora:02d}{minuto:02d}"
+                    if nivel == 'L1b':
+                        nombre_tgz = f"ABI-{nivel.upper()}-Rad{dom_code}-M6_{sat_code}-{timestamp_archivo}.tgz"
+                    else: # L2
+                        nombre_tgz = f"ABI-L2{dom_code}-M6_{sat_code}-{timestamp_archivo}.tgz"
 
-                        fecha_ymd_str = current_dt.strftime("%Y%m%d")
-                        objetivos.append({
-                            "nombre_archivo": nombre_tgz,
-                            "fecha_original_ymd": fecha_ymd_str,
-                            "horario_original": horario_str
-                        })
-                    current_dt += timedelta(minutes=1)
+                    objetivos.append({
+                        "nombre_archivo": nombre_tgz,
+                        "fecha_original_ymd": fecha_ymd_str,
+                        "horario_original": horario_str
+                    })
 
         # 2. Simular recuperación de Lustre, S3 y fallos
         lustre_recuperados = []
@@ -195,7 +203,7 @@ class BackgroundSimulator():
         # 3. Construir la consulta de recuperación
         consulta_recuperacion = None
         if objetivos_fallidos_final:
-            fechas_fallidas = defaultdict(list)
+            fechas_fallidas = defaultdict(dict)
             for obj in objetivos_fallidos_final:
                 fecha_ymd_fallida = obj["fecha_original_ymd"]
                 horario_original_fallido = obj["horario_original"]
@@ -208,8 +216,7 @@ class BackgroundSimulator():
                     
                     if start_date_str <= fecha_ymd_fallida <= end_date_str:
                         if horario_original_fallido in horarios_list:
-                            if horario_original_fallido not in fechas_fallidas[fecha_key_original]:
-                                fechas_fallidas[fecha_key_original].append(horario_original_fallido)
+                            fechas_fallidas[fecha_key_original][horario_original_fallido] = None
                             break # Pasar al siguiente objetivo fallido
             
             # Reconstruir la consulta de recuperación
@@ -217,7 +224,7 @@ class BackgroundSimulator():
             # Limpiar campos que no son parte del request
             consulta_recuperacion.pop('fechas', None)
             consulta_recuperacion.pop('creado_por', None)
-            consulta_recuperacion['fechas'] = dict(fechas_fallidas)
+            consulta_recuperacion['fechas'] = {fecha: list(horarios) for fecha, horarios in fechas_fallidas.items()}
             consulta_recuperacion['descripcion'] = f"Consulta de recuperación simulada para {consulta_id}"
 
         # 4. Simular la extracción de archivos si es necesario
@@ -1,6 +1,8 @@
 import sqlite3
 import json
 import logging
+import time
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -234,4 +236,65 @@ class ConsultasDatabase:
             'timestamp_creacion': row['timestamp_creacion'],
             'timestamp_actualizacion': row['timestamp_actualizacion'],
             'usuario': row['usuario']
-        }
\ No newline at end of file
+        }
+
+
+class ProgressThrottle:
+    """
+    Limita las escrituras de progreso ("procesando") de una consulta en la DB.
+    Se escribe sólo si el porcentaje cambió y pasaron al menos `intervalo_s` segundos desde la
+    última escritura. El último estado omitido queda pendiente; si su porcentaje difiere del
+    último escrito, un temporizador lo publica al cumplirse el intervalo aunque no lleguen más
+    actualizaciones. `flush()` publica lo pendiente de inmediato (también un mensaje nuevo con el
+    mismo porcentaje) y cancela el temporizador. Llamar a `flush()` antes del estado final.
+    """
+
+    def __init__(self, db, consulta_id: str, intervalo_s: float):
+        self.db = db
+        self.consulta_id = consulta_id
+        self.intervalo_s = intervalo_s
+        self._ultimo_ts: Optional[float] = None
+        self._ultimo_progreso: Optional[int] = None
+        self._pendiente: Optional[tuple] = None
+        self._temporizador: Optional[threading.Timer] = None
+        # El temporizador escribe desde su propio hilo
+        self._lock = threading.Lock()
+
+    def actualizar(self, progreso: int, mensaje: str, forzar: bool = False) -> bool:
+        """Publica (progreso, mensaje) si toca o si `forzar`; devuelve True si escribió en la DB."""
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and self._ultimo_ts is not None and (
+                progreso == self._ultimo_progreso or ahora - self._ultimo_ts < self.intervalo_s
+            ):
+                self._pendiente = (progreso, mensaje)
+                # Mismo porcentaje: no justifica una escritura diferida, sólo la de flush()
+                if progreso != self._ultimo_progreso and self._temporizador is None:
+                    restante = max(0.0, self.intervalo_s - (ahora - self._ultimo_ts))
+                    self._temporizador = threading.Timer(restante, self._flush_diferido)
+                    self._temporizador.daemon = True
+                    self._temporizador.start()
+                return False
+            self._escribir(progreso, mensaje, ahora)
+            return True
+
+    def flush(self) -> None:
+        """Escribe el último estado omitido, si lo hay, y cancela el temporizador pendiente."""
+        with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+            if self._pendiente is not None:
+                self._escribir(*self._pendiente, time.monotonic())
+
+    def _flush_diferido(self) -> None:
+        with self._lock:
+            self._temporizador = None
+            if self._pendiente is not None and self._pendiente[0] != self._ultimo_progreso:
+                self._escribir(*self._pendiente, time.monotonic())
+
+    def _escribir(self, progreso: int, mensaje: str, ahora: float) -> None:
+        self._pendiente = None
+        self._ultimo_ts = ahora
+        self._ultimo_progreso = progreso
+        self.db.actualizar_estado(self.consulta_id, "procesando", progreso, mensaje)
@@ -3,7 +3,7 @@ from fastapi.responses import JSONResponse
 from database import ConsultasDatabase, DATABASE_PATH
 from background_simulator import BackgroundSimulator
 from recover import RecoverFiles  # Importar el procesador real
-from s3_recover import _s3_circuit_breaker
+from s3_recover import _s3_circuit_breaker, _s3_retry_budget
 from processors import HistoricQueryProcessor
 from schemas import HistoricQueryRequest
 from datetime import datetime
@@ -182,6 +182,11 @@ async def health_check_detailed():
             "failure_threshold": _s3_circuit_breaker.failure_threshold,
             "recovery_timeout_s": _s3_circuit_breaker.recovery_timeout,
         },
+        "s3_retry_budget": {
+            "tokens": round(_s3_retry_budget.tokens, 2),
+            "rate_per_s": _s3_retry_budget.rate,
+            "burst": _s3_retry_budget.burst,
+        },
         "timestamp": datetime.now().isoformat()
     }
 
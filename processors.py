@@ -1,9 +1,15 @@
-from datetime import datetime, time, timedelta
+from datetime import date, datetime, time, timedelta
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any, TYPE_CHECKING
 if TYPE_CHECKING:
     from config_base import SatelliteConfigBase
 
+def _ymd_a_yjjj(fecha_ymd: str) -> str:
+    """YYYYMMDD -> YYYYJJJ por corte de cadena, sin strptime/strftime (ValueError si la fecha no existe)."""
+    dia = date(int(fecha_ymd[:4]), int(fecha_ymd[4:6]), int(fecha_ymd[6:8]))
+    return f"{dia.year:04d}{dia.timetuple().tm_yday:03d}"
+
+
 @dataclass
 class Horario:
     inicio: time
@@ -38,13 +44,10 @@ class Fecha:
         fecha_inicio = datetime.strptime(fecha_inicio_str, "%Y%m%d")
         fecha_fin = datetime.strptime(fecha_fin_str, "%Y%m%d")
         
-        fechas_expandidas = []
-        current_date = fecha_inicio
-        while current_date <= fecha_fin:
-            fechas_expandidas.append(current_date.strftime("%Y%m%d"))
-            current_date += timedelta(days=1)
-        
-        return fechas_expandidas
+        return [
+            (fecha_inicio + timedelta(days=i)).strftime("%Y%m%d")
+            for i in range((fecha_fin - fecha_inicio).days + 1)
+        ]
     
     def obtener_horarios_str(self) -> List[str]:
         """Convierte horarios a formato string HH:mm-HH:mm"""
@@ -93,7 +96,7 @@ class HistoricQuery:
             
             for fecha_ymd_str in fechas_individuales:
                 # Convertir YYYYMMDD a YYYYJJJ para uso interno
-                fecha_yjjj_str = datetime.strptime(fecha_ymd_str, "%Y%m%d").strftime("%Y%j")
+                fecha_yjjj_str = _ymd_a_yjjj(fecha_ymd_str)
                 fechas_dict[fecha_yjjj_str] = horarios_str.copy()
                 
                 # Para la copia de la solicitud original, usamos YYYYMMDD expandido
@@ -1,21 +1,34 @@
+import errno
 import logging
 import os
 import shutil
 import re
 import tarfile
-from typing import List, Dict, Iterable, Optional
-from datetime import datetime, timezone
+import threading
+import queue
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Iterable, Optional, Tuple
+from datetime import datetime, timezone, date, timedelta, time as dt_time
 from pathlib import Path
-from pebble import ProcessPool, ThreadPool
-from concurrent.futures import TimeoutError, as_completed
-from database import ConsultasDatabase
-from collections import defaultdict
-import time
-from s3_recover import S3RecoverFiles
+from pebble import ThreadPool
+from concurrent.futures import Future, TimeoutError, as_completed
+from database import ConsultasDatabase, ProgressThrottle
+from collections import defaultdict, deque
+from functools import lru_cache
+from contextlib import contextmanager
+from s3_recover import S3RecoverFiles, escanear_destino
 from config import SatelliteConfigGOES
 from settings import settings
 
-from settings import settings
+# Descompresión gzip acelerada (opcional): ISA-L (python-isal) o, en su defecto, zlib-ng.
+# Si ninguna está instalada se usa zlib vía tarfile.
+try:
+    from isal.igzip import IGzipFile as _GzipAcelerado
+except ImportError:
+    try:
+        from zlib_ng.gzip_ng import GzipNGFile as _GzipAcelerado
+    except ImportError:
+        _GzipAcelerado = None
 
 # Instanciar configuración para referenciar listas válidas (bandas/productos)
 _SAT_CONFIG = SatelliteConfigGOES()
@@ -50,92 +63,229 @@ def filter_files_by_time(archivos_nc: list, fecha_jjj: str, horarios_list: list)
                     archivos_filtrados.append(archivo)
     return archivos_filtrados
 
+@lru_cache(maxsize=128)
+def _build_base_path(source_data_path: Path, sensor: str, nivel: str, dominio: str) -> Path:
+    """Ruta base en Lustre para sensor/nivel/dominio; memoizada porque se repite en cada consulta."""
+    base_path = source_data_path / sensor / nivel
+    if dominio:
+        base_path /= dominio
+    return base_path
+
+
+@lru_cache(maxsize=256)
+def _directorio_anio(base_path: Path, anio: str) -> Path:
+    """Directorio del año bajo la ruta base; se reutiliza entre fechas del mismo año."""
+    return base_path / anio
+
+
+@lru_cache(maxsize=4096)
+def _semana_de(fecha_jjj: str) -> str:
+    """Nombre del directorio semanal ('01'..'53') para una fecha juliana YYYYJJJ."""
+    return f"{(int(fecha_jjj[4:]) - 1) // 7 + 1:02d}"
+
+
+@lru_cache(maxsize=4096)
+def _anio_ddd(fecha_jjj: str) -> str:
+    """Fecha juliana normalizada a YYYYJJJ (día con tres dígitos), prefijo de los timestamps -s."""
+    return f"{fecha_jjj[:4]}{int(fecha_jjj[4:]):03d}"
+
+
 # --- Clase para recuperación local (Lustre) ---
 class LustreRecoverFiles:
-    def __init__(self, source_data_path: str, logger):
+    def __init__(self, source_data_path: str, logger, max_workers: Optional[int] = None):
         self.source_data_path = Path(source_data_path)
         self.logger = logger
+        self.max_workers = max_workers or 1
 
     def build_base_path(self, query_dict: Dict) -> Path:
-        base_path = self.source_data_path
-        base_path /= query_dict.get('sensor', 'abi').lower()
-        base_path /= query_dict.get('nivel', 'l1b').lower()
-        if query_dict.get('dominio'):
-            base_path /= query_dict['dominio'].lower()
-        return base_path
+        return _build_base_path(
+            self.source_data_path,
+            query_dict.get('sensor', 'abi').lower(),
+            query_dict.get('nivel', 'l1b').lower(),
+            (query_dict.get('dominio') or '').lower(),
+        )
 
-    def find_files_for_day(self, base_path: Path, fecha_jjj: str) -> List[Path]:
-        anio = fecha_jjj[:4]
-        dia_del_anio_int = int(fecha_jjj[4:])
-        semana = (dia_del_anio_int - 1) // 7 + 1
-        directorio_semana = base_path / anio / f"{semana:02d}"
-        if not directorio_semana.exists():
+    def _directorio_semana(self, base_path: Path, fecha_jjj: str) -> Path:
+        return _directorio_anio(base_path, fecha_jjj[:4]) / _semana_de(fecha_jjj)
+
+    def _listar_tgz_semana(self, directorio_semana: Path) -> Optional[List[tuple]]:
+        """
+        Lista los .tgz de un directorio semanal como (nombre, ruta) con un solo readdir,
+        sin fnmatch ni stat por entrada. Devuelve None si el directorio no existe.
+        """
+        try:
+            with os.scandir(directorio_semana) as it:
+                return [
+                    (e.name, e.path) for e in it
+                    if e.name.endswith('.tgz') and e.is_file(follow_symlinks=False)
+                ]
+        except FileNotFoundError:
             self.logger.warning(f"⚠️ Directorio no encontrado en Lustre: {directorio_semana}")
+            return None
+
+    @staticmethod
+    def _candidatos_dia(listado: List[tuple], fecha_jjj: str) -> List[Path]:
+        needle = _anio_ddd(fecha_jjj)
+        return [Path(ruta) for nombre, ruta in listado if needle in nombre]
+
+    def find_files_for_day(self, base_path: Path, fecha_jjj: str) -> List[Path]:
+        directorio_semana = self._directorio_semana(base_path, fecha_jjj)
+        listado = self._listar_tgz_semana(directorio_semana)
+        if listado is None:
             return []
-        patron_dia = f"*{anio}{dia_del_anio_int:03d}*.tgz"
-        archivos_candidatos = list(directorio_semana.glob(patron_dia))
+        archivos_candidatos = self._candidatos_dia(listado, fecha_jjj)
         self.logger.debug(f"  Directorio: {directorio_semana}, Candidatos para el día {fecha_jjj}: {len(archivos_candidatos)}")
         return archivos_candidatos
 
     def filter_files_by_time(self, archivos_candidatos: List[Path], fecha_jjj: str, horarios_list: List[str]) -> List[Path]:
+        # Parsear el timestamp (-sYYYYJJJHHMM) de cada candidato una sola vez y ordenar,
+        # para resolver cada horario con dos búsquedas binarias en lugar de recorrer todo.
+        candidatos_ts = []
+        for archivo in archivos_candidatos:
+            try:
+                s_part_start_idx = archivo.name.find('-s')
+                if s_part_start_idx != -1:
+                    file_ts = int(archivo.name[s_part_start_idx + 2 : s_part_start_idx + 13])
+                    candidatos_ts.append((file_ts, archivo))
+            except (ValueError, IndexError, AttributeError):
+                continue
+        candidatos_ts.sort(key=lambda par: par[0])
+        ts_ordenados = [ts for ts, _ in candidatos_ts]
+
+        # Los horarios pueden solaparse: set para pertenencia O(1) y lista para conservar el orden
         archivos_filtrados_dia = []
+        vistos = set()
+        anio_ddd = _anio_ddd(fecha_jjj)  # prefijo común de todos los horarios del día
         for horario_str in horarios_list:
             partes = horario_str.split('-')
             inicio_hhmm = partes[0].replace(':', '')
             fin_hhmm = partes[1].replace(':', '') if len(partes) > 1 else inicio_hhmm
-            inicio_ts_str = f"{fecha_jjj}{inicio_hhmm}"
-            fin_ts_str = f"{fecha_jjj}{fin_hhmm}"
             try:
-                inicio_ts = int(inicio_ts_str)
-                fin_ts = int(fin_ts_str)
+                inicio_ts = int(anio_ddd + inicio_hhmm)
+                fin_ts = int(anio_ddd + fin_hhmm)
             except ValueError:
                 self.logger.warning(f"Formato de timestamp inválido para {fecha_jjj} con horario {horario_str}. Se omite.")
                 continue
             self.logger.debug(f"    Filtrando por rango horario: {horario_str} ({inicio_ts} - {fin_ts})")
-            for archivo in archivos_candidatos:
-                try:
-                    s_part_start_idx = archivo.name.find('-s')
-                    if s_part_start_idx != -1:
-                        file_ts_str = archivo.name[s_part_start_idx + 2 : s_part_start_idx + 13]
-                        file_ts = int(file_ts_str)
-                        if inicio_ts <= file_ts <= fin_ts:
-                            archivos_filtrados_dia.append(archivo)
-                except (ValueError, IndexError, AttributeError):
-                    continue
+            lo = bisect_left(ts_ordenados, inicio_ts)
+            hi = bisect_right(ts_ordenados, fin_ts)
+            for _, archivo in candidatos_ts[lo:hi]:
+                if archivo not in vistos:
+                    vistos.add(archivo)
+                    archivos_filtrados_dia.append(archivo)
         return archivos_filtrados_dia
 
     def discover_and_filter_files(self, query_dict: Dict) -> List[Path]:
+        """
+        Devuelve los .tgz fuente únicos que cubren la consulta.
+        Cada .tgz aparece una sola vez aunque satisfaga varios horarios o productos,
+        de modo que se abre y descomprime una única vez con la unión de bandas/productos.
+        """
         archivos_encontrados_set = set()
         base_path = self.build_base_path(query_dict)
+        # Agrupar las fechas por directorio semanal: cada directorio se lista una sola vez
+        # aunque la consulta pida varios días de la misma semana.
+        fechas_por_semana = defaultdict(list)
         for fecha_jjj, horarios_list in query_dict.get('fechas', {}).items():
-            archivos_candidatos_dia = self.find_files_for_day(base_path, fecha_jjj)
-            if not archivos_candidatos_dia:
-                continue
-            archivos_filtrados = self.filter_files_by_time(archivos_candidatos_dia, fecha_jjj, horarios_list)
-            archivos_encontrados_set.update(archivos_filtrados)
-        return sorted(list(archivos_encontrados_set))
-
-    def scan_existing_files(self, archivos_a_procesar: List[Path], destino: Path) -> List[Path]:
-        if not destino.exists() or not any(destino.iterdir()):
+            fechas_por_semana[self._directorio_semana(base_path, fecha_jjj)].append((fecha_jjj, horarios_list))
+
+        num_hilos = min(self.max_workers, len(fechas_por_semana))
+        if num_hilos <= 1:
+            for directorio_semana, fechas_semana in fechas_por_semana.items():
+                archivos_encontrados_set.update(self._scan_week(directorio_semana, fechas_semana))
+            return sorted(archivos_encontrados_set)
+
+        # El listado de directorios en Lustre está dominado por latencia: escanear las semanas en paralelo
+        with ThreadPool(max_workers=num_hilos) as pool:
+            futures = [
+                pool.schedule(self._scan_week, args=(directorio_semana, fechas_semana))
+                for directorio_semana, fechas_semana in fechas_por_semana.items()
+            ]
+            for future in as_completed(futures):
+                archivos_encontrados_set.update(future.result())
+        return sorted(archivos_encontrados_set)
+
+    def _scan_week(self, directorio_semana: Path, fechas_semana: List[tuple]) -> List[Path]:
+        """Lista un directorio semanal una vez y filtra por horario los candidatos de cada día pedido."""
+        listado = self._listar_tgz_semana(directorio_semana)
+        if not listado:
+            return []
+        archivos = []
+        for fecha_jjj, horarios_list in fechas_semana:
+            archivos_candidatos_dia = self._candidatos_dia(listado, fecha_jjj)
+            self.logger.debug(f"  Directorio: {directorio_semana}, Candidatos para el día {fecha_jjj}: {len(archivos_candidatos_dia)}")
+            if archivos_candidatos_dia:
+                archivos.extend(self.filter_files_by_time(archivos_candidatos_dia, fecha_jjj, horarios_list))
+        return archivos
+
+    def scan_existing_files(self, archivos_a_procesar: List[Path], destino: Path, existentes: Optional[Iterable[str]] = None) -> List[Path]:
+        """
+        Devuelve los archivos fuente cuyo timestamp aún no está en el destino.
+        `existentes` (nombres ya presentes, p. ej. el manifiesto de la consulta) evita volver a listar `destino`.
+        """
+        if existentes is None:
+            # Un solo readdir; is_file(follow_symlinks=False) usa el d_type de la entrada, sin stat por archivo
+            try:
+                with os.scandir(destino) as it:
+                    existentes = [e.name for e in it if e.is_file(follow_symlinks=False)]
+            except FileNotFoundError:
+                return archivos_a_procesar
+        timestamps_existentes = {
+            nombre[i + 2 : i + 13]
+            for nombre in existentes
+            if (i := nombre.find('_s')) != -1
+        }
+        if not timestamps_existentes:
             return archivos_a_procesar
-        timestamps_existentes = set()
-        for f in destino.iterdir():
-            if f.is_file():
-                s_part_start_idx = f.name.find('_s')
-                if s_part_start_idx != -1:
-                    timestamp_part = f.name[s_part_start_idx + 2 : s_part_start_idx + 13]
-                    timestamps_existentes.add(timestamp_part)
-        archivos_pendientes = []
-        for archivo_fuente in archivos_a_procesar:
-            s_part_start_idx = archivo_fuente.name.find('_s')
-            if s_part_start_idx != -1:
-                timestamp_fuente = archivo_fuente.name[s_part_start_idx + 2 : s_part_start_idx + 13]
-                if timestamp_fuente not in timestamps_existentes:
-                    archivos_pendientes.append(archivo_fuente)
-            else:
-                archivos_pendientes.append(archivo_fuente)
-        num_recuperados = len(archivos_a_procesar) - len(archivos_pendientes)
-        return archivos_pendientes
+        # Clave por archivo fuente calculada una sola vez (None si el nombre no trae timestamp).
+        # No se deduplica por timestamp: varios .tgz pueden compartirlo (p. ej. distintos productos).
+        claves_fuente = [
+            nombre[i + 2 : i + 13] if (i := nombre.find('_s')) != -1 else None
+            for nombre in (archivo.name for archivo in archivos_a_procesar)
+        ]
+        return [
+            archivo_fuente
+            for archivo_fuente, clave in zip(archivos_a_procesar, claves_fuente)
+            if clave is None or clave not in timestamps_existentes
+        ]
+
+
+# Alias de producto base para los conteos del reporte (variantes día/noche, etc.)
+_PRODUCTO_BASE_ALIAS = {
+    'CODD': 'COD', 'CODN': 'COD', 'COD': 'COD',
+    'CPSD': 'CPS', 'CPSN': 'CPS', 'CPS': 'CPS',
+    'VAAF': 'VAA', 'VAA': 'VAA',
+}
+
+
+def _extraer_producto_base(nombre: str) -> str:
+    """Producto L2 base de un nombre de archivo (sin sufijo de dominio); 'UNKNOWN' si no aplica."""
+    try:
+        i = nombre.index('-L2-') + 4
+        j = nombre.index('-M', i)
+        seg = nombre[i:j]
+        if seg.endswith('C') or seg.endswith('F'):
+            seg = seg[:-1]
+        elif seg.endswith('M1') or seg.endswith('M2'):
+            seg = seg[:-2]
+        return _PRODUCTO_BASE_ALIAS.get(seg, seg)
+    except Exception:
+        return 'UNKNOWN'
+
+
+def _parse_horario_rango(horario_rango: str) -> tuple:
+    """'HH:MM' o 'HH:MM-HH:MM' -> (inicio, fin) como time, por corte de cadena; (None, None) si es inválido."""
+    inicio_str, fin_str = (horario_rango.split('-') + [horario_rango])[:2]
+    try:
+        inicio_h, inicio_m = inicio_str.split(':')
+        fin_h, fin_m = fin_str.split(':')
+        return dt_time(int(inicio_h), int(inicio_m)), dt_time(int(fin_h), int(fin_m))
+    except ValueError:
+        return None, None
+
+
+# Copias de .tgz completos simultáneas por consulta: más hilos no aumentan el ancho de banda de Lustre
+_MAX_COPIAS_CONCURRENTES = 8
 
 
 # --- Clase principal orquestadora ---
@@ -145,20 +295,31 @@ class RecoverFiles:
         self.source_data_path = Path(source_data_path)
         self.base_download_path = Path(base_download_path)
         self.logger = logging.getLogger(__name__)
+        # Si origen y descargas comparten filesystem, los .tgz completos se enlazan (hardlink) en lugar de copiarse
+        try:
+            self._can_hardlink = os.stat(self.source_data_path).st_dev == os.stat(self.base_download_path).st_dev
+        except OSError:
+            self._can_hardlink = False
         self.executor = executor
         
         self.s3_fallback_enabled = settings.s3_fallback_enabled if s3_fallback_enabled is None else s3_fallback_enabled
         self.lustre_enabled = settings.lustre_enabled if lustre_enabled is None else lustre_enabled
         self.FILE_PROCESSING_TIMEOUT_SECONDS = file_processing_timeout_seconds or settings.file_processing_timeout_seconds
+        self.PROGRESS_UPDATE_INTERVAL_SECONDS = settings.progress_update_interval_seconds
+        # Extracciones simultáneas admitidas por el ancho de banda del disco destino (C* = B / b por tarea).
+        # Compartido por todas las consultas: más extracciones concurrentes sólo compiten por el mismo disco.
+        self.MAX_CONCURRENT_EXTRACTIONS = max(2, int(settings.disk_bandwidth_mb_s // settings.extract_task_mb_s))
+        self._extract_gate = threading.BoundedSemaphore(self.MAX_CONCURRENT_EXTRACTIONS)
 
         self.S3_RETRY_ATTEMPTS = settings.S3_RETRY_ATTEMPTS
         self.S3_RETRY_BACKOFF_SECONDS = settings.S3_RETRY_BACKOFF_SECONDS
         self.GOES19_OPERATIONAL_DATE = datetime.fromisoformat(settings.goes19_operational_date).replace(tzinfo=timezone.utc)
-        self.lustre = LustreRecoverFiles(source_data_path, self.logger)
 
         # Inicializa self.max_workers ANTES de usarla
         self.max_workers = max_workers or getattr(executor, "max_workers", settings.max_workers)
 
+        self.lustre = LustreRecoverFiles(source_data_path, self.logger, self.max_workers)
+
         self.s3 = S3RecoverFiles(self.logger, self.max_workers)
         # Limitar tamaño de listas en el reporte final para grandes volúmenes
         self.max_files_in_report = settings.max_files_per_query if settings.max_files_per_query > 0 else 1000
@@ -170,6 +331,11 @@ class RecoverFiles:
             directorio_destino.mkdir(exist_ok=True, parents=True)
             self.db.actualizar_estado(consulta_id, "procesando", 10, "Preparando entorno")
 
+            # Manifiesto nombre -> tamaño del destino: se lista una sola vez al inicio (archivos de una
+            # ejecución previa) y se actualiza con lo que devuelve cada etapa, sin volver a listar ni
+            # hacer stat para el reporte final.
+            manifiesto = escanear_destino(directorio_destino)
+
             objetivos_fallidos_local = []
             archivos_pendientes_local: List[Path] = []
 
@@ -191,7 +357,7 @@ class RecoverFiles:
 
                 # 3. Escanear destino
                 if archivos_a_procesar_local:
-                    archivos_pendientes_local = self.lustre.scan_existing_files(archivos_a_procesar_local, directorio_destino)
+                    archivos_pendientes_local = self.lustre.scan_existing_files(archivos_a_procesar_local, directorio_destino, manifiesto)
                     if not archivos_pendientes_local:
                         pass
                 else:
@@ -208,36 +374,71 @@ class RecoverFiles:
                 bandas_original = original_req.get('bandas', [])
                 productos_original_para_lustre = original_req.get('productos', [])
                 if archivos_pendientes_local:
-                    future_to_objetivo = {
-                        self.executor.schedule(
-                            _process_safe_recover_file, 
-                            args=(
-                                archivo_a_procesar, 
-                                directorio_destino, 
-                                query_dict.get('nivel'), 
-                                productos_original_para_lustre, # Usar la lista completa original para la lógica interna
-                                bandas_original # Usar la lista original para la lógica interna
-                            ), 
-                            timeout=self.FILE_PROCESSING_TIMEOUT_SECONDS
-                        ): archivo_a_procesar
-                        for i, archivo_a_procesar in enumerate(archivos_pendientes_local)
-                    }
-                    # Procesar tareas a medida que van completando para evitar bloquearse por una sola tarea lenta
-                    for i, future in enumerate(as_completed(list(future_to_objetivo.keys()))):
-                        archivo_fuente = future_to_objetivo[future]
-                        try:
-                            future.result()
-                            mensaje = f"Recuperado archivo {i+1}/{total_pendientes} ({archivo_fuente.name})"
-                        except TimeoutError:
-                            self.logger.error(f"❌ Timeout en archivo {archivo_fuente.name}")
-                            objetivos_fallidos_local.append(archivo_fuente)
-                            mensaje = f"Falla por timeout {i+1}/{total_pendientes} ({archivo_fuente.name})"
-                        except Exception as e:
-                            self.logger.error(f"❌ Error procesando el archivo {archivo_fuente.name}: {e}")
-                            objetivos_fallidos_local.append(archivo_fuente)
-                            mensaje = f"Falla {i+1}/{total_pendientes} ({archivo_fuente.name})"
-                        progreso = 20 + int(((i + 1) / total_pendientes) * 60)
-                        self.db.actualizar_estado(consulta_id, "procesando", progreso, mensaje)
+                    nivel_query = query_dict.get('nivel')
+                    # Usar las listas originales del request para la lógica interna (copiar tgz vs. extraer)
+                    args_comunes = (directorio_destino, nivel_query, productos_original_para_lustre, bandas_original, self._can_hardlink)
+                    copiar_completo = _debe_copiar_tgz_completo(
+                        (nivel_query or "").upper(),
+                        *_normalizar_solicitud(productos_original_para_lustre, bandas_original),
+                    )
+                    # Copiar/enlazar .tgz completos es E/S pura: va a un ThreadPool dimensionado para E/S,
+                    # sin serializar a procesos. La extracción selectiva (gzip, CPU) sigue en el ProcessPool.
+                    pool_copia = None
+                    copias_vencidas = threading.Event()
+                    if copiar_completo:
+                        # Una tarea por hilo (no una por archivo) que va tomando archivos de una cola común.
+                        # Cada hilo publica el resultado de cada archivo en la cola para el progreso. El hilo de
+                        # la consulta no copia: queda libre para reportar progreso y escribir el estado final.
+                        por_copiar = deque(archivos_pendientes_local)
+                        cerrojo_por_copiar = threading.Lock()
+                        cola_copias: "queue.Queue" = queue.Queue()
+                        num_hilos = min(_MAX_COPIAS_CONCURRENTES, self.max_workers, total_pendientes)
+                        pool_copia = ThreadPool(max_workers=num_hilos)
+                        for _ in range(num_hilos):
+                            pool_copia.schedule(_copiar_lote, args=(por_copiar, cerrojo_por_copiar, args_comunes, cola_copias, copias_vencidas))
+                        # Plazo en el consumidor: una copia atascada en E/S no puede matarse, pero sí darse por fallida
+                        completados = _resultados_con_plazo(
+                            cola_copias, archivos_pendientes_local, self.FILE_PROCESSING_TIMEOUT_SECONDS, copias_vencidas
+                        )
+                    else:
+                        # La extracción escribe al disco destino: se programa con la compuerta de ancho de banda
+                        completados = _programar_con_compuerta(
+                            self._extract_gate,
+                            lambda archivo_a_procesar: self.executor.schedule(
+                                _process_safe_recover_file,
+                                args=(archivo_a_procesar,) + args_comunes,
+                                timeout=self.FILE_PROCESSING_TIMEOUT_SECONDS
+                            ),
+                            archivos_pendientes_local,
+                            precargar=_precargar,
+                        )
+                    progreso_local = ProgressThrottle(self.db, consulta_id, self.PROGRESS_UPDATE_INTERVAL_SECONDS)
+                    try:
+                        # Procesar tareas a medida que van completando para evitar bloquearse por una sola tarea lenta.
+                        # El progreso se calcula sólo aquí, al completarse cada archivo.
+                        for hechos, (future, archivo_fuente) in enumerate(completados, start=1):
+                            try:
+                                for ruta, tamaño in future.result():
+                                    manifiesto[ruta.name] = tamaño
+                                mensaje = f"Recuperado archivo {hechos}/{total_pendientes} ({archivo_fuente.name})"
+                            except TimeoutError:
+                                self.logger.error(f"❌ Timeout en archivo {archivo_fuente.name}")
+                                objetivos_fallidos_local.append(archivo_fuente)
+                                mensaje = f"Falla por timeout {hechos}/{total_pendientes} ({archivo_fuente.name})"
+                            except Exception as e:
+                                self.logger.error(f"❌ Error procesando el archivo {archivo_fuente.name}: {e}")
+                                objetivos_fallidos_local.append(archivo_fuente)
+                                mensaje = f"Falla {hechos}/{total_pendientes} ({archivo_fuente.name})"
+                            progreso = 20 + (hechos * 60) // total_pendientes
+                            progreso_local.actualizar(progreso, mensaje, forzar=(hechos == total_pendientes))
+                    finally:
+                        # También ante un error: que ningún progreso diferido pise el estado final
+                        progreso_local.flush()
+                        if pool_copia is not None:
+                            pool_copia.close()
+                            # Con copias vencidas algún hilo puede seguir atascado: no esperarlo
+                            if not copias_vencidas.is_set():
+                                pool_copia.join()
             else:
                 # Saltar por completo la etapa local si Lustre está deshabilitado
                 self.db.actualizar_estado(consulta_id, "procesando", 20, "Lustre deshabilitado; saltando recuperación local.")
@@ -272,10 +473,15 @@ class RecoverFiles:
                     q_l1b = dict(query_dict)
                     s3_map.update(self.s3.discover_files(q_l1b, self.GOES19_OPERATIONAL_DATE))
 
+                # Agrupar una sola vez los objetos por fecha juliana de su timestamp, para que cada fecha
+                # filtre sólo sus propios archivos en lugar de recorrer todo el mapa
+                s3_por_fecha = defaultdict(list)
+                for ruta_s3 in s3_map.values():
+                    if (match := _FILENAME_TIMESTAMP_RE.search(ruta_s3)):
+                        s3_por_fecha[match[1] + match[2]].append(ruta_s3)
                 archivos_s3_filtrados = []
                 for fecha_jjj, horarios_list in query_dict.get('fechas', {}).items():
-                    archivos_encontrados = [s3_map[k] for k in s3_map]
-                    archivos_s3_filtrados += filter_files_by_time(archivos_encontrados, fecha_jjj, horarios_list)
+                    archivos_s3_filtrados += filter_files_by_time(s3_por_fecha.get(fecha_jjj, []), fecha_jjj, horarios_list)
                 objetivos_finales_s3 = list(set(archivos_s3_filtrados))
                 # Publicar un mensaje con conteo antes de iniciar descargas
                 try:
@@ -285,7 +491,7 @@ class RecoverFiles:
                     pass
 
                 s3_recuperados, objetivos_fallidos_s3 = self.s3.download_files(
-                    consulta_id, objetivos_finales_s3, directorio_destino, self.db
+                    consulta_id, objetivos_finales_s3, directorio_destino, self.db, manifiesto
                 )
                 # Excluir de las fallas locales los archivos que S3 sí recuperó,
                 # para no contarlos como fallidos en el mensaje final.
@@ -298,10 +504,7 @@ class RecoverFiles:
                 s3_recuperados = []
                 objetivos_fallidos_final = objetivos_fallidos_local
 
-            # 6. Generar reporte final
-            # Usar scandir para obtener nombre + tamaño en una sola pasada del OS,
-            # evitando stat() individual por cada archivo (crítico con cientos de miles).
-            dest_entries = [e for e in os.scandir(directorio_destino) if e.is_file(follow_symlinks=False)]
+            # 6. Generar reporte final a partir del manifiesto, sin recorrer de nuevo el destino
             self.db.actualizar_estado(consulta_id, "procesando", 95, "Generando reporte final")
             
             # Obtener la consulta para acceder al timestamp de creación
@@ -309,7 +512,7 @@ class RecoverFiles:
             timestamp_creacion = consulta_db.get("timestamp_creacion") if consulta_db else datetime.now().isoformat()
 
             resultados_finales = self._generar_reporte_final(
-                consulta_id, dest_entries, s3_recuperados, directorio_destino, objetivos_fallidos_final, query_dict, timestamp_creacion
+                consulta_id, manifiesto, s3_recuperados, directorio_destino, objetivos_fallidos_final, query_dict, timestamp_creacion
             )
             # Mensaje final breve y legible
             total_recuperados = resultados_finales.get("total_archivos", 0)
@@ -328,8 +531,20 @@ class RecoverFiles:
         if not objetivos_fallidos:
             return None
 
-        fechas_fallidas = defaultdict(list)
+        # dict como conjunto ordenado de horarios (conserva el orden de aparición)
+        fechas_fallidas = defaultdict(dict)
         original_fechas = query_original.get('_original_request', {}).get('fechas', {})
+        # Claves y rangos originales parseados una sola vez por consulta, no por archivo fallido:
+        # (clave, inicio YYYYMMDD, fin YYYYMMDD, [(horario, inicio, fin) ...]); None si el horario es inválido
+        rangos_originales = [
+            (
+                fecha_key_original,
+                fecha_key_original.split('-')[0],
+                fecha_key_original.split('-')[-1],
+                [(horario_rango, *_parse_horario_rango(horario_rango)) for horario_rango in horarios_list],
+            )
+            for fecha_key_original, horarios_list in original_fechas.items()
+        ]
 
         for archivo_fallido in objetivos_fallidos:
             try:
@@ -337,26 +552,26 @@ class RecoverFiles:
                 # archivo_fallido puede ser Path (Lustre) o str (S3 fallidos)
                 nombre_fallido = archivo_fallido.name if hasattr(archivo_fallido, 'name') else archivo_fallido
                 ts_str = nombre_fallido.split('-s')[1].split('.')[0][:11]
-                fecha_fallida_dt = datetime.strptime(ts_str, '%Y%j%H%M')
-                fecha_fallida_ymd = fecha_fallida_dt.strftime('%Y%m%d')
+                # Aritmética directa en lugar de strptime/strftime (ValueError si el timestamp es inválido)
+                dia_juliano = int(ts_str[4:7])
+                if len(ts_str) != 11 or not 1 <= dia_juliano <= 366:
+                    raise ValueError(f"Timestamp inválido: {ts_str}")
+                fecha_fallida = date(int(ts_str[:4]), 1, 1) + timedelta(days=dia_juliano - 1)
+                hora_fallida = dt_time(int(ts_str[7:9]), int(ts_str[9:11]))
+                fecha_fallida_ymd = f"{fecha_fallida.year:04d}{fecha_fallida.month:02d}{fecha_fallida.day:02d}"
 
                 # 2. Encontrar la clave de fecha y el rango horario originales.
-                for fecha_key_original, horarios_list in original_fechas.items():
+                for fecha_key_original, start_date_str, end_date_str, horarios_parseados in rangos_originales:
                     # Comprobar si la fecha del archivo está dentro del rango de la clave (ej. "20230101-20230105")
-                    start_date_str = fecha_key_original.split('-')[0]
-                    end_date_str = fecha_key_original.split('-')[-1]
                     if not (start_date_str <= fecha_fallida_ymd <= end_date_str):
                         continue
 
-                    for horario_rango in horarios_list:
+                    for horario_rango, inicio_t, fin_t in horarios_parseados:
                         # Comprobar si la hora del archivo está dentro del rango horario.
-                        inicio_str, fin_str = (horario_rango.split('-') + [horario_rango])[:2]
-                        inicio_t = datetime.strptime(inicio_str, '%H:%M').time()
-                        fin_t = datetime.strptime(fin_str, '%H:%M').time()
-
-                        if inicio_t <= fecha_fallida_dt.time() <= fin_t:
-                            if horario_rango not in fechas_fallidas[fecha_key_original]:
-                                fechas_fallidas[fecha_key_original].append(horario_rango)
+                        if inicio_t is None:
+                            raise ValueError(f"Horario inválido: {horario_rango}")
+                        if inicio_t <= hora_fallida <= fin_t:
+                            fechas_fallidas[fecha_key_original][horario_rango] = None
                             break # Encontrado el rango horario, pasar al siguiente archivo.
                     else:
                         continue
@@ -368,13 +583,13 @@ class RecoverFiles:
         if fechas_fallidas:
             consulta_recuperacion = query_original.get('_original_request', {}).copy()
             consulta_recuperacion.pop('creado_por', None)
-            consulta_recuperacion['fechas'] = dict(fechas_fallidas)
+            consulta_recuperacion['fechas'] = {fecha: list(horarios) for fecha, horarios in fechas_fallidas.items()}
             consulta_recuperacion['descripcion'] = f"Consulta de recuperación para la solicitud original {consulta_id}"
             return consulta_recuperacion
         
         return None
 
-    def _generar_reporte_final(self, consulta_id: str, dest_entries: list, s3_recuperados: List[Path], directorio_destino: Path, objetivos_fallidos: List[Path], query_original: Dict, timestamp_creacion_iso: str) -> Dict:
+    def _generar_reporte_final(self, consulta_id: str, manifiesto: Dict[str, int], s3_recuperados: List[Path], directorio_destino: Path, objetivos_fallidos: List[Path], query_original: Dict, timestamp_creacion_iso: str) -> Dict:
         """Genera el diccionario de resultados finales."""
         # --- Cálculo de la duración total del procesamiento ---
         timestamp_finalizacion = datetime.now()
@@ -386,40 +601,18 @@ class RecoverFiles:
         except (ValueError, TypeError):
             self.logger.warning(f"No se pudo calcular la duración para la consulta {consulta_id} debido a un timestamp inválido.")
 
-        from collections import defaultdict as _dd
-
-        def _extraer_producto_base(nombre: str) -> str:
-            try:
-                i = nombre.index('-L2-') + 4
-                j = nombre.index('-M', i)
-                seg = nombre[i:j]
-                if seg.endswith('C') or seg.endswith('F'):
-                    seg = seg[:-1]
-                elif seg.endswith('M1') or seg.endswith('M2'):
-                    seg = seg[:-2]
-                alias = {
-                    'CODD': 'COD', 'CODN': 'COD', 'COD': 'COD',
-                    'CPSD': 'CPS', 'CPSN': 'CPS', 'CPS': 'CPS',
-                    'VAAF': 'VAA', 'VAA': 'VAA',
-                }
-                return alias.get(seg, seg)
-            except Exception:
-                return 'UNKNOWN'
-
         # Conjunto de nombres S3 para clasificación rápida O(1)
         s3_names_set = {p.name for p in s3_recuperados}
         s3_names_full = [p.name for p in s3_recuperados]
 
-        # Recorrido único: tamaño total + conteos por producto en una sola pasada
-        # DirEntry.stat() usa el resultado cacheado del scandir — sin syscalls extra
+        # Recorrido único del manifiesto (nombre -> tamaño): total + conteos por producto, sin syscalls
         total_bytes = 0
         lustre_names_full = []
-        conteo_total_por_producto = _dd(int)
-        conteo_s3_por_producto = _dd(int)
+        conteo_total_por_producto = defaultdict(int)
+        conteo_s3_por_producto = defaultdict(int)
 
-        for entry in dest_entries:
-            nombre = entry.name
-            total_bytes += entry.stat(follow_symlinks=False).st_size
+        for nombre, tamaño in manifiesto.items():
+            total_bytes += tamaño
             prod = _extraer_producto_base(nombre)
             if prod != 'UNKNOWN':
                 conteo_total_por_producto[prod] += 1
@@ -452,7 +645,7 @@ class RecoverFiles:
             },
             "conteo_por_producto": dict(sorted(conteo_total_por_producto.items())),
             "conteo_por_producto_s3": dict(sorted(conteo_s3_por_producto.items())),
-            "total_archivos": len(dest_entries),
+            "total_archivos": len(manifiesto),
             "total_mb": tamaño_mb,
             "ruta_destino": str(directorio_destino),
             "timestamp_procesamiento": datetime.now().isoformat(),
@@ -465,170 +658,451 @@ class RecoverFiles:
         p = (producto or "").strip().upper()
         return n == "L1B" or (n == "L2" and p.startswith("CMI"))
 
-    def _iter_patrones_l2(
-        self,
-        productos: List[str],
-        dominio: str,
-        bandas: List[str],
-        sat_code: str,
-        ts_inicio: str,
-        ts_fin: str,
-    ) -> Iterable[str]:
-        """
-        Genera patrones de filename para L2.
-        - CMI/CMIP/CMIPC: incluye banda como M6Cdd
-        - Otros (p.ej. ACHA/ACTP): sin banda (solo M6)
-        """
-        dom_letter = "C" if dominio == "conus" else "F"
-        productos_upper = [p.strip().upper() for p in (productos or [])]
-        bandas = bandas or []
-
-        for prod in productos_upper:
-            # Mapeo especial para S3
-            if prod in ("CODD", "CODN", "COD"):
-                prod_s3 = "COD"
-            elif prod in ("CPSD", "CPSN", "CPS"):
-                prod_s3 = "CPS"
-            elif prod in ("VAAF", "VAA"):
-                prod_s3 = "VAA"
-            else:
-                prod_s3 = prod
-
-            if prod_s3.startswith("CMI"):
-                # Si no se enviaron bandas, usa ALL (16) o deja que aguas abajo expanda.
-                iter_bandas = bandas or [f"{i:02d}" for i in range(1, 17)]
-                for b in iter_bandas:
-                    b2 = f"{int(b):02d}" if str(b).isdigit() else str(b)
-                    yield f"CG_ABI-L2-{prod_s3}{dom_letter}-M6C{b2}_{sat_code}_s{ts_inicio}_e{ts_fin}_c*.nc"
-            else:
-                yield f"CG_ABI-L2-{prod_s3}{dom_letter}-M6_{sat_code}_s{ts_inicio}_e{ts_fin}_c*.nc"
 
-    # En donde actualmente construyes los patrones para buscar en Lustre/S3,
-    # reemplaza el bloque que usa 'bandas' para todos los productos por algo como:
-    def _construir_patrones_busqueda(self, query: Dict) -> List[str]:
-        """
-        Construye los patrones de archivo a buscar según la query.
-        """
-        nivel = (query.get("nivel") or "").upper()
-        dominio = query.get("dominio")
-        productos = query.get("productos") or []
-        sat_code = self._sat_to_code(query.get("sat"))  # asume que existe
-        ts_inicio, ts_fin = self._rangos_a_timestamps(query)  # asume que existe
-
-        patrones: List[str] = []
-
-        if nivel == "L1B":
-            # Mantén tu lógica actual para L1B con bandas
-            # ...existing code...
-            pass
-        elif nivel == "L2":
-            # USAR patrones por producto (bandas solo para CMI)
-            patrones.extend(
-                list(
-                    self._iter_patrones_l2(
-                        productos=productos,
-                        dominio=dominio,
-                        bandas=query.get("bandas") or [],
-                        sat_code=sat_code,
-                        ts_inicio=ts_inicio,
-                        ts_fin=ts_fin,
-                    )
-                )
-            )
-        else:
-            # ...existing code...
-            pass
+def _copiar_lote(pendientes: "deque", cerrojo: threading.Lock, args_comunes: tuple, completados: "queue.Queue", cancelado: threading.Event) -> None:
+    """
+    Copia/enlaza .tgz completos tomándolos de `pendientes` (deque compartida, protegida por `cerrojo`)
+    hasta vaciarla, y publica (future, archivo) en `completados` por cada archivo, con el resultado o
+    la excepción ya resueltos. Con pendientes comunes, un archivo atascado sólo retiene a su hilo: los demás toman los siguientes.
+    Se detiene sin tomar más archivos si `cancelado` (el consumidor ya los dio por vencidos).
+    """
+    usar_hardlink = args_comunes[-1]
+    while not cancelado.is_set():
+        with cerrojo:
+            if not pendientes:
+                return
+            archivo = pendientes.popleft()
+            proximo = pendientes[0] if pendientes else None
+        # Pedir al kernel que lea el próximo .tgz pendiente mientras se copia éste (un hardlink no lee datos)
+        if proximo is not None and not usar_hardlink:
+            _precargar(proximo)
+        future = Future()
+        try:
+            future.set_result(_process_safe_recover_file(archivo, *args_comunes))
+        except Exception as e:
+            future.set_exception(e)
+        completados.put((future, archivo))
+
+
+def _resultados_con_plazo(cola: "queue.Queue", objetivos: list, plazo_s: float, vencido: threading.Event):
+    """
+    Genera los (future, archivo) que _copiar_lote publica en `cola` a medida que llegan. Si pasan
+    `plazo_s` segundos sin ningún resultado nuevo, marca `vencido` y genera cada archivo aún no
+    entregado con un futuro fallido por TimeoutError, para que la consulta registre la falla y termine.
+    """
+    entregados = set()
+    for _ in range(len(objetivos)):
+        try:
+            future, archivo = cola.get(timeout=plazo_s)
+        except queue.Empty:
+            vencido.set()
+            for archivo in objetivos:
+                if archivo not in entregados:
+                    future = Future()
+                    future.set_exception(TimeoutError(f"Sin resultado tras {plazo_s}s: {archivo}"))
+                    yield future, archivo
+            return
+        entregados.add(archivo)
+        yield future, archivo
+
+
+def _programar_con_compuerta(compuerta: threading.BoundedSemaphore, programar, objetivos: list, precargar=None):
+    """
+    Programa cada objetivo con `programar(objetivo)` sólo tras adquirir `compuerta`, que se libera
+    al terminar su futuro. Un hilo alimentador hace la programación para que el llamador pueda
+    consumir resultados mientras tanto. Genera (future, objetivo) en orden de finalización.
+    Si se da `precargar`, se llama con cada objetivo antes de esperar la compuerta.
+
+    El timeout de pebble cuenta desde que la tarea arranca, así que esperar en la compuerta
+    no consume el tiempo límite de cada archivo.
+    """
+    completados: "queue.Queue" = queue.Queue()
+
+    def _al_terminar(future, objetivo):
+        compuerta.release()
+        completados.put((future, objetivo))
+
+    def _alimentar():
+        for objetivo in objetivos:
+            if precargar is not None:
+                precargar(objetivo)
+            compuerta.acquire()
+            try:
+                future = programar(objetivo)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+                _al_terminar(future, objetivo)
+                continue
+            future.add_done_callback(lambda f, o=objetivo: _al_terminar(f, o))
+
+    threading.Thread(target=_alimentar, name="extract-feeder", daemon=True).start()
+    for _ in range(len(objetivos)):
+        yield completados.get()
 
-        logging.debug(f"Patrones L2 generados: {patrones}")
-        return patrones
 
 # --- Funciones a nivel de módulo para ProcessPoolExecutor ---
 # ProcessPoolExecutor requiere que las funciones que se ejecutan en otros procesos
 # estén definidas a nivel superior del módulo, no como métodos de una clase.
 
-def _process_safe_recover_file(archivo_fuente: Path, directorio_destino: Path, nivel: str, productos_solicitados_list: List[str], bandas_solicitadas_list: List[str]) -> List[Path]:
+# Tamaño del búfer para copiar cada miembro extraído a disco y para leer el .tgz en modo
+# streaming (2 MiB en lugar de los 16 KiB de copyfileobj y los 10 KiB de registro de tarfile)
+_EXTRACT_BUFFER_SIZE = 2 * 1024 * 1024
+
+
+# Directorios ya creados en este proceso worker; se conserva entre archivos y consultas para
+# hacer un solo mkdir por directorio. Se vacía al crecer demasiado.
+_MKDIR_CACHE: set = set()
+_MKDIR_CACHE_MAX = 4096
+
+# Bloques en vuelo hacia el hilo escritor (16 x 2 MiB = 32 MiB como máximo por worker)
+_WRITER_QUEUE_CHUNKS = 16
+
+# Búferes de _EXTRACT_BUFFER_SIZE reutilizados entre miembros, archivos y consultas del mismo worker:
+# el lector los llena con readinto y el hilo escritor los devuelve tras escribirlos. Se crean bajo
+# demanda hasta _BUFFER_POOL_SIZE (uno por bloque en cola, más el que se llena y el que se escribe).
+_BUFFER_POOL_SIZE = _WRITER_QUEUE_CHUNKS + 2
+_BUFFER_POOL: "queue.Queue[bytearray]" = queue.Queue()
+_buffers_creados = 0
+
+
+def _tomar_buffer() -> bytearray:
+    """Toma un búfer libre del pool; si no hay y aún no se alcanzó el tope, crea uno nuevo."""
+    global _buffers_creados
+    try:
+        return _BUFFER_POOL.get_nowait()
+    except queue.Empty:
+        if _buffers_creados < _BUFFER_POOL_SIZE:
+            _buffers_creados += 1
+            return bytearray(_EXTRACT_BUFFER_SIZE)
+        return _BUFFER_POOL.get()
+
+
+class _EscritorMiembros:
     """
-    Función segura para procesos que procesa un único archivo .tgz.
-    Verifica accesibilidad, y luego lo copia o extrae su contenido según la consulta.
+    Hilo escritor para la extracción selectiva. El gzip sólo se puede descomprimir en secuencia,
+    pero la escritura a disco (open/write/close, costosos en Lustre/NFS) puede solaparse con él:
+    el hilo principal encola la ruta de cada miembro y sus bloques, y este hilo los escribe.
+    La cola acotada limita la memoria en vuelo.
     """
-    archivos_recuperados = []
-    
-    # Normalizar entradas para facilitar las comprobaciones
-    # Normalizar para aceptar string o lista
+
+    def __init__(self):
+        self._cola = queue.Queue(maxsize=_WRITER_QUEUE_CHUNKS)
+        self._error: Optional[BaseException] = None
+        self._hilo = threading.Thread(target=self._run, name="extract-writer", daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cola.put(None)
+        self._hilo.join()
+        if exc_type is None and self._error is not None:
+            raise self._error
+        return False
+
+    def _run(self):
+        salida = None
+        try:
+            while True:
+                item = self._cola.get()
+                if item is None:
+                    break
+                if self._error is not None:
+                    if not isinstance(item, str):
+                        _BUFFER_POOL.put(item[0])
+                    continue  # drenar la cola tras un error para no bloquear al productor
+                try:
+                    if isinstance(item, str):
+                        if salida is not None:
+                            salida.close()
+                            salida = None
+                        try:
+                            salida = open(item, 'wb', buffering=0)
+                        except FileNotFoundError:
+                            # El directorio pudo purgarse después de quedar en la caché de mkdir: recrearlo
+                            os.makedirs(os.path.dirname(item), exist_ok=True)
+                            salida = open(item, 'wb', buffering=0)
+                    else:
+                        buf, n = item
+                        try:
+                            vista = memoryview(buf)[:n]
+                            while vista:
+                                vista = vista[salida.write(vista):]
+                        finally:
+                            _BUFFER_POOL.put(buf)
+                except OSError as e:
+                    self._error = e
+        finally:
+            if salida is not None:
+                salida.close()
+
+    def abrir(self, ruta: str) -> None:
+        if self._error is not None:
+            raise self._error
+        self._cola.put(ruta)
+
+    def escribir(self, buf: bytearray, n: int) -> None:
+        """Encola los primeros `n` bytes de `buf`; el hilo escritor devuelve `buf` al pool."""
+        self._cola.put((buf, n))
+
+
+def _extraer_miembro(tar: tarfile.TarFile, miembro: tarfile.TarInfo, dest_str: str, mkdir_cache: set, escritor: _EscritorMiembros) -> str:
+    """
+    Descomprime un miembro del tar en búferes reutilizados del pool y los entrega al hilo escritor;
+    devuelve su ruta (str).
+    Evita extractall (copias de 16 KiB, chown/utime por miembro) y rechaza rutas fuera del destino.
+    `mkdir_cache` guarda los directorios ya creados para hacer un solo mkdir por directorio único.
+    """
+    nombre = miembro.name
+    if os.path.isabs(nombre) or '..' in nombre.split('/'):
+        raise tarfile.ExtractError(f"Ruta de miembro no permitida: {nombre}")
+    # Operaciones sobre str (os.path) en lugar de Path: este es el bucle caliente de la extracción
+    destino = os.path.join(dest_str, nombre)
+    parent = os.path.dirname(destino)
+    if parent not in mkdir_cache:
+        os.makedirs(parent, exist_ok=True)
+        mkdir_cache.add(parent)
+    escritor.abrir(destino)
+    with tar.extractfile(miembro) as origen:
+        while True:
+            buf = _tomar_buffer()
+            try:
+                n = origen.readinto(buf)
+            except BaseException:
+                _BUFFER_POOL.put(buf)
+                raise
+            if not n:
+                _BUFFER_POOL.put(buf)
+                break
+            escritor.escribir(buf, n)
+    return destino
+
+
+@contextmanager
+def _abrir_tgz_stream(archivo_fuente: Path):
+    """Abre un .tgz en modo streaming ("r|"), descomprimiendo con python-isal o zlib-ng si están disponibles."""
+    with open(archivo_fuente, "rb", buffering=0) as crudo:
+        # Lectura estrictamente secuencial: el kernel puede ampliar el read-ahead del origen
+        _fadvise(crudo.fileno(), "SEQUENTIAL")
+        if _GzipAcelerado is None:
+            with tarfile.open(fileobj=crudo, mode="r|gz", bufsize=_EXTRACT_BUFFER_SIZE) as tar:
+                yield tar
+        else:
+            with _GzipAcelerado(fileobj=crudo, mode="rb") as gz, tarfile.open(fileobj=gz, mode="r|", bufsize=_EXTRACT_BUFFER_SIZE) as tar:
+                yield tar
+
+
+def _token_banda(nombre: str) -> str:
+    """
+    Devuelve el token de banda ('C02', 'C13', ...) de un nombre tipo
+    OR_ABI-L1b-RadF-M6C02_G16_s..., que precede siempre a '_G<sat>'. Cadena vacía si no hay.
+    """
+    idx = nombre.find('_G')
+    return nombre[idx - 3:idx] if idx >= 3 else ""
+
+
+def _fadvise(fd: int, consejo: str, offset: int = 0, longitud: int = 0) -> None:
+    """
+    Pista posix_fadvise al kernel sobre `fd` (`consejo` es el sufijo de la constante: 'DONTNEED',
+    'SEQUENTIAL', 'WILLNEED'...). Sólo es una pista: sin soporte en la plataforma o ante error, no hace nada.
+    """
+    valor = getattr(os, f"POSIX_FADV_{consejo}", None)
+    if valor is None:
+        return
+    try:
+        os.posix_fadvise(fd, offset, longitud, valor)
+    except OSError:
+        pass
+
+
+def _precargar(archivo: Path) -> None:
+    """Inicia la lectura anticipada de `archivo` en la caché de páginas (POSIX_FADV_WILLNEED) sin esperarla."""
+    try:
+        fd = os.open(archivo, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        _fadvise(fd, "WILLNEED")
+    finally:
+        os.close(fd)
+
+
+def _copiar_archivo(archivo_fuente: Path, destino: Path) -> None:
+    """
+    Copia con os.copy_file_range: la copia ocurre en el kernel (o en el servidor/reflink si el
+    filesystem lo soporta) sin pasar por espacio de usuario. Si no está disponible, usa shutil.copyfile.
+    """
+    # Como shutil.copyfile: nunca truncar el origen si el destino ya es el mismo archivo (hardlink previo)
+    try:
+        if os.path.samefile(archivo_fuente, destino):
+            raise shutil.SameFileError(f"{archivo_fuente} y {destino} son el mismo archivo")
+    except FileNotFoundError:
+        pass
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(archivo_fuente, 'rb') as src, open(destino, 'wb') as dst:
+                restante = os.fstat(src.fileno()).st_size
+                while restante > 0:
+                    copiados = os.copy_file_range(src.fileno(), dst.fileno(), restante)
+                    if copiados == 0:
+                        break
+                    restante -= copiados
+                # El .tgz copiado no se vuelve a leer en este nodo: no dejarlo ocupando la caché de páginas
+                _fadvise(src.fileno(), "DONTNEED")
+                _fadvise(dst.fileno(), "DONTNEED")
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    # shutil.copyfile usa sendfile en Linux y omite copymode
+    shutil.copyfile(archivo_fuente, destino)
+
+
+def _enlazar_o_copiar(archivo_fuente: Path, destino: Path, usar_hardlink: bool) -> None:
+    """
+    Crea `destino` como hardlink de `archivo_fuente` cuando es posible (mismo filesystem);
+    si el enlace no está permitido (EXDEV, EPERM, ...) recurre a shutil.copyfile.
+    """
+    if usar_hardlink:
+        try:
+            os.link(archivo_fuente, destino)
+            return
+        except FileExistsError:
+            if os.path.samefile(archivo_fuente, destino):
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK):
+                raise
+    _copiar_archivo(archivo_fuente, destino)
+
+
+def _normalizar_solicitud(productos_solicitados_list, bandas_solicitadas_list) -> tuple:
+    """Normaliza productos (mayúsculas) y bandas a sets; acepta string o lista."""
     if isinstance(productos_solicitados_list, str):
         productos_solicitados_list = [productos_solicitados_list]
     if isinstance(bandas_solicitadas_list, str):
         bandas_solicitadas_list = [bandas_solicitadas_list]
     productos_solicitados = set(p.upper() for p in (productos_solicitados_list or []))
     bandas_solicitadas = set(bandas_solicitadas_list or [])
+    return productos_solicitados, bandas_solicitadas
+
+
+@lru_cache(maxsize=64)
+def _filtros_miembros(productos_solicitados: frozenset, bandas_solicitadas: frozenset) -> tuple:
+    """
+    Predicados de la extracción selectiva para una solicitud normalizada:
+    (tokens de banda L1b, tokens de banda para CMI, prefijos de producto L2, ¿todos los productos?).
+    Memoizados por worker: todos los .tgz de una consulta comparten los mismos.
+    """
+    # Si se pidió 'ALL' (o la lista ya fue expandida a todas las bandas),
+    # CMI usa todas (01-16). Si no, se usan las especificadas.
+    bandas_all_set = frozenset(_SAT_CONFIG.VALID_BANDAS)
+    bandas_para_cmi = bandas_all_set if ('ALL' in bandas_solicitadas or bandas_solicitadas == bandas_all_set) else bandas_solicitadas
+    return (
+        frozenset(f"C{b}" for b in bandas_solicitadas),
+        frozenset(f"C{b}" for b in bandas_para_cmi),
+        tuple(sorted(productos_solicitados)),
+        'ALL' in productos_solicitados,
+    )
+
+
+def _debe_copiar_tgz_completo(nivel_upper: str, productos_solicitados: set, bandas_solicitadas: set) -> bool:
+    """
+    Decide entre copiar el .tgz completo o extraer selectivamente. Reglas:
+    1. L1b y bandas="ALL" -> Copiar .tgz completo.
+    2. L2, bandas="ALL" y productos="ALL" -> Copiar .tgz completo.
+    3. En todos los demás casos, se debe extraer selectivamente.
+    """
     # Detectar si la consulta originalmente pidió 'ALL' aunque la request ya haya
     # sido expandida a la lista completa de bandas/productos. Usamos la config
     # para comparar contra el conjunto completo de valores válidos.
     productos_all_set = set(p.upper() for p in _SAT_CONFIG.VALID_PRODUCTS)
     bandas_all_set = set(_SAT_CONFIG.VALID_BANDAS)
-    nivel_upper = (nivel or "").upper()
 
-    # --- Lógica de decisión: Copiar .tgz completo vs. Extracción selectiva ---
-    # Basado en las reglas definidas:
-    # 1. L1b y bandas="ALL" -> Copiar .tgz completo.
-    # 2. L2, bandas="ALL" y productos="ALL" -> Copiar .tgz completo.
-    # 3. En todos los demás casos, se debe extraer selectivamente.
-    
     # Considerar que se pidió 'ALL' cuando:
     # - la lista contiene literalmente 'ALL' (caso no expandido), o
     # - la lista equivale exactamente al conjunto válido completo (caso expandido)
     bandas_indican_all = ('ALL' in bandas_solicitadas) or (bandas_solicitadas == bandas_all_set)
     productos_indican_all = ('ALL' in productos_solicitados) or (productos_solicitados == productos_all_set)
 
-    copiar_tgz_completo = (
+    return (
         (nivel_upper == 'L1B' and bandas_indican_all) or
         (nivel_upper == 'L2' and bandas_indican_all and productos_indican_all)
     )
 
+
+def _process_safe_recover_file(archivo_fuente: Path, directorio_destino: Path, nivel: str, productos_solicitados_list: List[str], bandas_solicitadas_list: List[str], usar_hardlink: bool = False) -> List[Tuple[Path, int]]:
+    """
+    Función segura para procesos que procesa un único archivo .tgz.
+    Verifica accesibilidad, y luego lo copia o extrae su contenido según la consulta.
+    Devuelve (ruta, tamaño) de cada archivo escrito, para el manifiesto de la consulta.
+    """
+    archivos_recuperados = []
+
+    # Normalizar entradas para facilitar las comprobaciones
+    productos_solicitados, bandas_solicitadas = _normalizar_solicitud(productos_solicitados_list, bandas_solicitadas_list)
+    nivel_upper = (nivel or "").upper()
+
+    # --- Lógica de decisión: Copiar .tgz completo vs. Extracción selectiva ---
+    copiar_tgz_completo = _debe_copiar_tgz_completo(nivel_upper, productos_solicitados, bandas_solicitadas)
+
     if copiar_tgz_completo:
-        shutil.copy(archivo_fuente, directorio_destino)
-        archivos_recuperados.append(directorio_destino / archivo_fuente.name)
+        destino = directorio_destino / archivo_fuente.name
+        _enlazar_o_copiar(archivo_fuente, destino, usar_hardlink)
+        archivos_recuperados.append((destino, archivo_fuente.stat().st_size))
         return archivos_recuperados
 
+    # Sin filtros aplicables ningún miembro puede coincidir: fallar antes de abrir y descomprimir el .tgz
+    if (
+        (nivel_upper == 'L1B' and not bandas_solicitadas) or
+        (nivel_upper == 'L2' and not productos_solicitados) or
+        nivel_upper not in ('L1B', 'L2')
+    ):
+        raise FileNotFoundError(f"No se encontraron archivos internos que coincidieran con la solicitud en {archivo_fuente.name}")
+
     # --- Lógica de extracción selectiva ---
     try:
-        with tarfile.open(archivo_fuente, "r:gz") as tar:
-            miembros_del_tar = tar.getmembers()
-            miembros_a_extraer = []
-
-            # Determinar qué bandas usar para productos CMI
-            # Si se pidió 'ALL' (o la lista ya fue expandida a todas las bandas),
-            # se usan todas (01-16). Si no, se usan las especificadas.
-            bandas_para_cmi = set(bandas_all_set) if (('ALL' in bandas_solicitadas) or (bandas_solicitadas == bandas_all_set)) else bandas_solicitadas
+        # Una sola pasada hacia adelante sobre el gzip, sin índice de acceso aleatorio
+        with _abrir_tgz_stream(archivo_fuente) as tar, _EscritorMiembros() as escritor:
+            # Conjuntos de búsqueda compartidos por todos los .tgz de la misma solicitud (no por miembro)
+            banda_tokens, cmi_banda_tokens, prod_prefijos, todos_los_productos = _filtros_miembros(
+                frozenset(productos_solicitados), frozenset(bandas_solicitadas)
+            )
 
-            # Iterar sobre cada archivo dentro del .tgz
-            for miembro in miembros_del_tar:
+            # Recorrer el .tgz en streaming y extraer cada coincidencia al vuelo: sin getmembers()
+            # previo ni retroceder en el gzip (que obligaría a descomprimir de nuevo desde el inicio)
+            if len(_MKDIR_CACHE) > _MKDIR_CACHE_MAX:
+                _MKDIR_CACHE.clear()
+            mkdir_cache = _MKDIR_CACHE
+            dest_str = str(directorio_destino)
+            for miembro in tar:
                 if not miembro.isfile():
                     continue
+                nombre = miembro.name
 
                 # Lógica para L1b: extraer si la banda está en la lista solicitada
-                if nivel_upper == 'L1B' and any(f"C{b}_" in miembro.name for b in bandas_solicitadas):
-                    miembros_a_extraer.append(miembro)
+                if nivel_upper == 'L1B' and _token_banda(nombre) in banda_tokens:
+                    archivos_recuperados.append((Path(_extraer_miembro(tar, miembro, dest_str, mkdir_cache, escritor)), miembro.size))
                     continue
 
                 # Lógica para L2: más compleja
                 if nivel_upper == 'L2':
                     # Extraer si el producto está en la lista (o si se pidió 'ALL' productos)
-                    if 'ALL' in productos_solicitados or any(f"-L2-{p.upper()}" in miembro.name for p in productos_solicitados):
+                    idx_l2 = nombre.find('-L2-')
+                    if todos_los_productos or (idx_l2 != -1 and nombre.startswith(prod_prefijos, idx_l2 + 4)):
                         # Si es un producto CMI, verificar también la banda
-                        if 'CMI' in miembro.name and not any(f"C{b}_" in miembro.name for b in bandas_para_cmi):
+                        if 'CMI' in nombre and _token_banda(nombre) not in cmi_banda_tokens:
                             continue  # Es CMI pero no de la banda correcta, saltar
-                        miembros_a_extraer.append(miembro)
-            
-            if miembros_a_extraer:
-                tar.extractall(path=directorio_destino, members=miembros_a_extraer)
-                for miembro in miembros_a_extraer:
-                    archivos_recuperados.append(directorio_destino / miembro.name)
-            
-            if not miembros_a_extraer:
+                        archivos_recuperados.append((Path(_extraer_miembro(tar, miembro, dest_str, mkdir_cache, escritor)), miembro.size))
+
+            if not archivos_recuperados:
                 raise FileNotFoundError(f"No se encontraron archivos internos que coincidieran con la solicitud en {archivo_fuente.name}")
 
-    except (tarfile.ReadError, tarfile.ExtractError, FileNotFoundError) as e:
+    # Con _GzipAcelerado (isal/zlib-ng) un .tgz corrupto o truncado llega como gzip.BadGzipFile
+    # (OSError) o EOFError en lugar de tarfile.ReadError
+    except (tarfile.ReadError, tarfile.StreamError, tarfile.ExtractError, FileNotFoundError, OSError, EOFError) as e:
         logging.error(f"❌ Error al procesar el archivo tar {archivo_fuente.name} (posiblemente corrupto): {e}")
         raise
 
@@ -1,20 +1,29 @@
-import s3fs
+import asyncio
+import os
 import random
+import re
 import time
 import threading
 from pathlib import Path
-from typing import List, Dict, Optional
-from datetime import datetime, timezone
-from pebble import ProcessPool, ThreadPool
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+from datetime import datetime, timezone, timedelta
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
 from concurrent.futures import TimeoutError, as_completed
 from settings import settings
+from database import ProgressThrottle
+
+if TYPE_CHECKING:
+    # s3fs arrastra aiobotocore/botocore/aiohttp: se importa al crear el cliente, no al cargar el módulo
+    import s3fs
 
 
 class S3CircuitBreaker:
     """
     Circuit breaker thread-safe para llamadas a S3.
 
-    Estado compartido entre todos los workers del ThreadPool.
+    Estado compartido entre todas las descargas y listados concurrentes.
     - closed:    operación normal, las llamadas se ejecutan.
     - open:      S3 está fallando; las llamadas se rechazan de inmediato.
     - half-open: tras `recovery_timeout` segundos, permite una prueba.
@@ -62,12 +71,209 @@ class S3CircuitBreaker:
         return f"S3CircuitBreaker(state={self._state}, failures={self._failures})"
 
 
-# Singleton a nivel de módulo — compartido entre todos los workers del ThreadPool.
+class S3RetryBudget:
+    """
+    Presupuesto de reintentos S3 (token bucket) thread-safe.
+
+    Cada reintento consume un token; los tokens se reponen a `rate` por segundo
+    hasta un máximo de `burst`. Sin tokens disponibles el reintento se omite y la
+    operación falla de inmediato, acotando la carga extra que generan los reintentos
+    cuando muchas operaciones fallan por la misma causa (throttling, caída regional).
+    """
+
+    def __init__(self, rate: float = 5.0, burst: int = 10):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def try_acquire(self) -> bool:
+        """Consume un token si hay disponible; devuelve False si el presupuesto está agotado."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def __repr__(self) -> str:  # útil para logs
+        return f"S3RetryBudget(tokens={self._tokens:.1f}, rate={self.rate}, burst={self.burst})"
+
+
+# Singletons a nivel de módulo — compartidos por todas las operaciones S3 del proceso.
 _s3_circuit_breaker = S3CircuitBreaker(
     failure_threshold=5,
     recovery_timeout=60,
 )
+_s3_retry_budget = S3RetryBudget(rate=5.0, burst=10)
+
+
+def _backoff_full_jitter(base: float, attempt: int) -> float:
+    """
+    Espera antes del reintento `attempt` con "full jitter": uniforme en [0, min(tope, base·2^attempt)].
+    Descorrelaciona los reintentos de descargas que fallan a la vez (p. ej. throttling de S3).
+    """
+    return random.uniform(0, min(settings.S3_RETRY_MAX_BACKOFF_SECONDS, base * (2 ** attempt)))
+
+
+# Listados S3 (LIST) simultáneos al descubrir archivos
+_S3_LS_CONCURRENCIA = 32
+# Canal ABI en el nombre NetCDF: ...-M6C13_G16_...
+_S3_CANAL_RE = re.compile(r'-M\d+C(\d{2})_')
+# Timestamp de inicio en el nombre NetCDF: _sAAAAJJJHHMM...
+_S3_TIMESTAMP_RE = re.compile(r'_s(\d{7})(\d{2})(\d{2})')
+# Caché de listados por hora: vigencia de horas recientes, antigüedad a partir de la cual una hora
+# ya no cambia (se cachea sin vencimiento) y tope de entradas (se descarta la menos usada)
+_S3_LS_CACHE_TTL_SECONDS = 300
+_S3_LS_INMUTABLE_TRAS = timedelta(hours=24)
+_S3_LS_CACHE_MAX_ENTRADAS = 2048
+# Horas distintas pedidas de un mismo día a partir de las cuales se lista el día entero
+# (unas pocas páginas de LIST) en lugar de un LIST por hora
+_S3_LS_DIA_MIN_HORAS = 6
+# Tope de tamaños de objetos descubiertos que se recuerdan para las descargas
+_S3_TAMAÑOS_MAX_ENTRADAS = 200_000
+
+
+# Descarga por rangos: objetos >= umbral se piden en partes concurrentes de este tamaño
+_S3_RANGE_THRESHOLD_BYTES = 32 * 1024 * 1024
+_S3_RANGE_PART_BYTES = 8 * 1024 * 1024
+# Partes en vuelo por objeto: acota la memoria (8 x 8 MiB) y el número de conexiones por archivo.
+# Cota global de memoria en el proceso de la API: S3_MAX_CONCURRENT_DOWNLOADS x 8 partes x 8 MiB,
+# unos 2 GiB con los valores por defecto (32 descargas).
+_S3_RANGE_MAX_CONCURRENCIA = 8
+
+
+# Caudal mínimo que se espera de una descarga (compartiendo el enlace con las demás) para fijar
+# el límite de tiempo de cada intento según el tamaño del objeto
+_S3_MIN_BYTES_POR_SEGUNDO = 1024 * 1024
+
+
+def _timeout_por_intento(tamaño: int) -> float:
+    """Segundos para un intento de descarga de `tamaño` bytes: conexión + lectura + transferencia a caudal mínimo."""
+    return settings.S3_CONNECT_TIMEOUT + settings.S3_READ_TIMEOUT + tamaño / _S3_MIN_BYTES_POR_SEGUNDO
+
 
+# Sufijo del temporal de descarga; se renombra al nombre final sólo cuando el objeto está completo
+_S3_SUFIJO_PARCIAL = ".part"
+
+
+async def _get_file_por_rangos(s3_client: "s3fs.S3FileSystem", archivo_remoto_s3: str, ruta_local: str, size: Optional[int] = None) -> int:
+    """
+    Descarga un objeto S3 a disco y devuelve su tamaño. Los objetos grandes se piden con GET por
+    rangos concurrentes escritos con pwrite sobre un archivo preasignado; los pequeños, en un solo GET.
+    `size` es el tamaño conocido por el LIST; sólo si falta se consulta con un HEAD.
+    """
+    if size is None:
+        info = await s3_client._info(archivo_remoto_s3)
+        size = info.get('size') or 0
+    if size < _S3_RANGE_THRESHOLD_BYTES:
+        await s3_client._get_file(archivo_remoto_s3, ruta_local)
+        return size
+
+    fd = os.open(ruta_local, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        semaforo_partes = asyncio.Semaphore(_S3_RANGE_MAX_CONCURRENCIA)
+        loop = asyncio.get_running_loop()
+        escrituras = []
+
+        async def _parte(inicio: int) -> None:
+            fin = min(inicio + _S3_RANGE_PART_BYTES, size)
+            async with semaforo_partes:
+                datos = await s3_client._cat_file(archivo_remoto_s3, start=inicio, end=fin)
+                if len(datos) != fin - inicio:
+                    raise IOError(f"Rango incompleto {inicio}-{fin} de {archivo_remoto_s3}: {len(datos)} bytes")
+                # El pwrite va a un hilo para no frenar el event loop compartido (demás descargas y LIST).
+                # shield: si se cancela la parte, la escritura ya lanzada termina y se espera antes del close.
+                escritura = loop.run_in_executor(None, os.pwrite, fd, datos, inicio)
+                escrituras.append(escritura)
+                await asyncio.shield(escritura)
+
+        partes = [asyncio.ensure_future(_parte(inicio)) for inicio in range(0, size, _S3_RANGE_PART_BYTES)]
+        try:
+            await asyncio.gather(*partes)
+        finally:
+            # Si una parte falla (o se cancela la descarga), gather no detiene a las demás: cancelarlas
+            # y esperarlas antes de cerrar fd, para que ninguna escriba en un descriptor ya reutilizado
+            for parte in partes:
+                parte.cancel()
+            await asyncio.gather(*partes, return_exceptions=True)
+            await asyncio.gather(*escrituras, return_exceptions=True)
+    finally:
+        os.close(fd)
+    return size
+
+
+@lru_cache(maxsize=256)
+def _ventanas_fusionadas(horarios: Tuple[str, ...]) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    Rangos 'HH:MM[-HH:MM]' como ventanas en minutos del día, ordenadas y con los solapes fusionados;
+    devuelve (inicios, fines) para ubicar un minuto con una búsqueda binaria.
+    """
+    ventanas = []
+    for horario_str in horarios:
+        inicio, fin = (horario_str.split('-') + [horario_str])[:2]
+        ventanas.append((int(inicio[:2]) * 60 + int(inicio[3:5]), int(fin[:2]) * 60 + int(fin[3:5])))
+    inicios, fines = [], []
+    for inicio_hm, fin_hm in sorted(ventanas):
+        if fines and inicio_hm <= fines[-1]:
+            fines[-1] = max(fines[-1], fin_hm)
+        else:
+            inicios.append(inicio_hm)
+            fines.append(fin_hm)
+    return tuple(inicios), tuple(fines)
+
+
+def _norm_prefix(prefijo: str) -> str:
+    """Prefijo de LIST terminado en '/', para que S3 liste sólo el contenido de ese "directorio"."""
+    return prefijo if prefijo.endswith('/') else prefijo + '/'
+
+
+def escanear_destino(directorio: Path) -> Dict[str, int]:
+    """
+    Manifiesto nombre -> tamaño de los archivos regulares ya presentes en `directorio`, con una
+    sola pasada de os.scandir; vacío si el directorio no existe. Lo usan recover y download_files.
+    Se omiten los temporales .part que deja una descarga interrumpida: no son resultados.
+    """
+    manifiesto = {}
+    try:
+        with os.scandir(directorio) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False) and not entry.name.endswith(_S3_SUFIJO_PARCIAL):
+                    manifiesto[entry.name] = entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return manifiesto
+
+
+def _basename(ruta_s3: str) -> str:
+    """Nombre de archivo de una clave S3 por corte de cadena, sin construir un Path."""
+    return ruta_s3[ruta_s3.rfind('/') + 1:]
+
+
+@lru_cache(maxsize=128)
+def _sat_code(satellite_name: str, is_post_g19: bool) -> str:
+    """Código de satélite (G16/G18/G19...) para un nombre de la API; memoizado por nombre y época."""
+    if satellite_name == "GOES-EAST":
+        return "G19" if is_post_g19 else "G16"
+    if satellite_name == "GOES-WEST":
+        return "G18"
+    if '-' in satellite_name:
+        return f"G{satellite_name.split('-')[-1]}"
+    return satellite_name
 
 
 class S3RecoverFiles:
@@ -76,17 +282,40 @@ class S3RecoverFiles:
         self.max_workers = max_workers
         self.retry_attempts = settings.S3_RETRY_ATTEMPTS
         self.retry_backoff = settings.S3_RETRY_BACKOFF_SECONDS
+        # Cliente S3 compartido entre consultas; se crea en el primer uso
+        self._s3 = None
+        self._s3_lock = threading.Lock()
+        # Caché de listados por prefijo (hora o día): ruta -> (expira en time.monotonic() o None, [(clave, tamaño)]).
+        # Sólo se accede desde corrutinas en el event loop de s3fs (un único hilo), así que no requiere lock.
+        self._ls_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # Tamaño de cada objeto descubierto según el LIST (clave S3 -> bytes), para descargar sin HEAD previo
+        self._tamaños_s3: Dict[str, int] = {}
+
+    @property
+    def s3(self) -> "s3fs.S3FileSystem":
+        """
+        Cliente S3 anónimo reutilizado para conservar el pool de conexiones (keep-alive). Los
+        reintentos de botocore se desactivan: cada llamada ya pasa por los reintentos propios con
+        backoff, presupuesto y circuit breaker, y apilarlos multiplicaría los intentos.
+        """
+        if self._s3 is None:
+            with self._s3_lock:
+                if self._s3 is None:
+                    import s3fs
+                    self._s3 = s3fs.S3FileSystem(anon=True, config_kwargs={
+                        'connect_timeout': settings.S3_CONNECT_TIMEOUT,
+                        'read_timeout': settings.S3_READ_TIMEOUT,
+                        # Suficientes conexiones para las descargas y los LIST simultáneos
+                        'max_pool_connections': max(64, self.max_workers, settings.S3_MAX_CONCURRENT_DOWNLOADS, _S3_LS_CONCURRENCIA),
+                        'tcp_keepalive': True,
+                        'retries': {'total_max_attempts': 1, 'mode': 'standard'},
+                    })
+        return self._s3
 
     def get_sat_code_for_date(self, satellite_name: str, request_date: datetime, goes19_operational_date: datetime) -> str:
         if request_date.tzinfo is None:
             request_date = request_date.replace(tzinfo=timezone.utc)
-        if satellite_name == "GOES-EAST":
-            return "G19" if request_date >= goes19_operational_date else "G16"
-        if satellite_name == "GOES-WEST":
-            return "G18"
-        if '-' in satellite_name:
-            return f"G{satellite_name.split('-')[-1]}"
-        return satellite_name
+        return _sat_code(satellite_name, request_date >= goes19_operational_date)
 
     def get_s3_product_names(self, query_dict: Dict) -> List[str]:
         sensor = query_dict.get('sensor', 'abi').upper()
@@ -108,14 +337,19 @@ class S3RecoverFiles:
         sat_code = self.get_sat_code_for_date(sat_name, request_date, goes19_operational_date)
         s3_bucket = f"noaa-goes{sat_code.replace('G', '')}"
         s3_product_names = self.get_s3_product_names(query_dict)
-        # Timeouts y reintentos para robustez en producción
-        base_backoff = self.retry_backoff
-        jitter = random.uniform(0, 0.5)
-        self.retry_backoff = max(1.0, base_backoff) + jitter
-        s3 = s3fs.S3FileSystem(anon=True, config_kwargs={'connect_timeout': settings.S3_CONNECT_TIMEOUT, 'read_timeout': settings.S3_READ_TIMEOUT})
-        objetivos_s3_a_descargar = set()
-        bandas_solicitadas = query_dict.get('bandas')
-        # ...resto del método...
+        # Las partes constantes de la ruta se arman una sola vez fuera de los bucles
+        prefijos_producto = [f"{s3_bucket}/{name}" for name in s3_product_names]
+        s3 = self.s3
+        objetivos_s3_a_descargar: Dict[str, int] = {}
+        # Canales pedidos como '01'..'16', para compararlos con el canal extraído de cada nombre
+        canales_solicitados = frozenset(f"{int(b):02d}" for b in query_dict.get('bandas') or [])
+
+        # 1. Armar todos los prefijos a listar, con la fecha y horarios que filtran su listado. Un día del que se
+        #    piden muchas horas se lista entero (producto/año/día, paginado de a 1000 claves) en lugar de hora por
+        #    hora; el filtro por horario del paso 3 descarta lo que sobra. Los prefijos que terminaron hace más de
+        #    un día ya no cambian en S3: su listado se cachea sin vencimiento.
+        limite_inmutable = datetime.now(timezone.utc) - _S3_LS_INMUTABLE_TRAS
+        prefijos = []
         for fecha_jjj, horarios_list in query_dict.get('fechas', {}).items():
             # Permitir tanto YYYYMMDD como YYYYJJJ
             if len(fecha_jjj) == 8:  # YYYYMMDD
@@ -127,92 +361,151 @@ class S3RecoverFiles:
                 dia_juliano = fecha_jjj[4:].zfill(3)
             else:
                 raise ValueError(f"Formato de fecha no soportado: {fecha_jjj}")
-            
+
+            sufijo_dia = f"/{anio}/{dia_juliano}/"
+            inicio_dia = datetime(int(anio), 1, 1, tzinfo=timezone.utc) + timedelta(days=int(dia_juliano) - 1)
+            fecha_filtro = f"{anio}{dia_juliano}"
+            # Horas únicas del día: rangos solapados no repiten el LIST de la misma hora
+            horas = set()
             for horario_str in horarios_list:
                 inicio_hh = int(horario_str.split(':')[0])
                 fin_hh = int(horario_str.split('-')[1].split(':')[0]) if '-' in horario_str else inicio_hh
-                for hora in range(inicio_hh, fin_hh + 1):
-                    for s3_product_name in s3_product_names:
-                        s3_path_hora = f"{s3_bucket}/{s3_product_name}/{anio}/{dia_juliano}/{hora:02d}/"
-                        try:
-                            archivos_en_hora = None
-                            last_exc = None
-                            for attempt in range(self.retry_attempts):
-                                if _s3_circuit_breaker.is_open:
-                                    self.logger.warning(
-                                        f"S3 circuit breaker open — omitiendo ls en {s3_path_hora}"
-                                    )
-                                    archivos_en_hora = []
-                                    break
-                                try:
-                                    archivos_en_hora = s3.ls(s3_path_hora)
-                                    _s3_circuit_breaker.record_success()
-                                    break
-                                except FileNotFoundError:
-                                    archivos_en_hora = []
-                                    break
-                                except Exception as e:
-                                    _s3_circuit_breaker.record_failure()
-                                    last_exc = e
-                                    wait = self.retry_backoff * (2 ** attempt)
-                                    time.sleep(wait)
-                            if archivos_en_hora is None:
-                                # Si después de reintentos sigue fallando, omitir esta hora
-                                if last_exc:
-                                    try:
-                                        self.logger.debug(f"LS S3 falló {self.retry_attempts} veces en {s3_path_hora}: {last_exc}")
-                                    except Exception:
-                                        pass
-                                continue
-
-                            archivos_nc = [f for f in archivos_en_hora if f.endswith('.nc')]
-                            bandas_solicitadas = query_dict.get('bandas')
-                            if bandas_solicitadas:
-                                bandas_solicitadas_str = [str(b) for b in bandas_solicitadas]
-                                archivos_nc = [
-                                    f for f in archivos_nc
-                                    if any(f"C{b}" in f for b in bandas_solicitadas_str)
-                                ]
-
-                            archivos_filtrados = self.filter_files_by_time(archivos_nc, f"{anio}{dia_juliano}", horarios_list)
-
-                            objetivos_s3_a_descargar.update(archivos_filtrados)
-                        except FileNotFoundError:
-                            continue
-
-        return {Path(f).name: f for f in objetivos_s3_a_descargar}
-
-
-    def download_files(self, consulta_id: str, archivos_s3: List[str], directorio_destino: Path, db) -> (List[Path], List[str]):
-        s3 = s3fs.S3FileSystem(anon=True, config_kwargs={'connect_timeout': settings.S3_CONNECT_TIMEOUT, 'read_timeout': settings.S3_READ_TIMEOUT})
+                horas.update(range(inicio_hh, fin_hh + 1))
+            if len(horas) >= _S3_LS_DIA_MIN_HORAS:
+                inmutable = inicio_dia + timedelta(days=1) <= limite_inmutable
+                for prefijo_producto in prefijos_producto:
+                    prefijos.append((prefijo_producto + sufijo_dia, fecha_filtro, horarios_list, inmutable, True))
+                continue
+            for hora in sorted(horas):
+                hora_dir = f"{hora:02d}/"
+                inmutable = inicio_dia + timedelta(hours=hora + 1) <= limite_inmutable
+                for prefijo_producto in prefijos_producto:
+                    prefijos.append((prefijo_producto + sufijo_dia + hora_dir, fecha_filtro, horarios_list, inmutable, False))
+
+        # 2. Listar todos los prefijos de forma concurrente en el event loop de s3fs: cada LIST
+        #    es una ida y vuelta de red, así que el tiempo total pasa de N·RTT a unas pocas RTT.
+        async def _listar_todos():
+            semaforo = asyncio.Semaphore(_S3_LS_CONCURRENCIA)
+            return await asyncio.gather(*(self._ls_cacheado(s3, ruta, semaforo, inmutable, dia_completo)
+                                           for ruta, _, _, inmutable, dia_completo in prefijos))
+
+        listados = asyncio.run_coroutine_threadsafe(_listar_todos(), s3.loop).result() if prefijos else []
+
+        # 3. Filtrar cada listado por banda y horario
+        for (_, fecha_filtro, horarios_list, _, _), archivos_en_hora in zip(prefijos, listados):
+            if archivos_en_hora is None:
+                continue  # Falló tras los reintentos: omitir este prefijo
+            tamaños = dict(archivos_en_hora)  # el listado ya trae sólo objetos .nc
+            if canales_solicitados:
+                archivos_nc = [
+                    f for f in tamaños
+                    if (m := _S3_CANAL_RE.search(f)) and m[1] in canales_solicitados
+                ]
+            else:
+                archivos_nc = list(tamaños)
+            for f in self.filter_files_by_time(archivos_nc, fecha_filtro, horarios_list):
+                objetivos_s3_a_descargar[f] = tamaños[f]
+
+        if len(self._tamaños_s3) > _S3_TAMAÑOS_MAX_ENTRADAS:
+            self._tamaños_s3.clear()
+        self._tamaños_s3.update(objetivos_s3_a_descargar)
+        return {_basename(f): f for f in objetivos_s3_a_descargar}
+
+
+    async def _ls_cacheado(self, s3_client: "s3fs.S3FileSystem", s3_path_hora: str, semaforo: asyncio.Semaphore, inmutable: bool, dia_completo: bool = False) -> Optional[List[Tuple[str, int]]]:
+        """
+        Listado de un prefijo (hora o día completo) a través de la caché: vigente _S3_LS_CACHE_TTL_SECONDS,
+        o sin vencimiento si el prefijo es `inmutable`. Los fallos y el circuito abierto no se cachean.
+        """
+        ahora = time.monotonic()
+        entrada = self._ls_cache.get(s3_path_hora)
+        if entrada is not None:
+            expira, listado = entrada
+            if expira is None or ahora < expira:
+                self._ls_cache.move_to_end(s3_path_hora)
+                return listado
+            del self._ls_cache[s3_path_hora]
+        listado = await self._ls_con_reintentos(s3_client, s3_path_hora, semaforo, dia_completo)
+        # Con el circuito abierto el [] no es un listado real: no se cachea
+        if listado is not None and not _s3_circuit_breaker.is_open:
+            self._ls_cache[s3_path_hora] = (None if inmutable else ahora + _S3_LS_CACHE_TTL_SECONDS, listado)
+            if len(self._ls_cache) > _S3_LS_CACHE_MAX_ENTRADAS:
+                self._ls_cache.popitem(last=False)
+        return listado
+
+    async def _ls_con_reintentos(self, s3_client: "s3fs.S3FileSystem", s3_path_hora: str, semaforo: asyncio.Semaphore, dia_completo: bool = False) -> Optional[List[Tuple[str, int]]]:
+        """
+        Lista un prefijo S3 con reintentos, circuit breaker y presupuesto de reintentos; con `dia_completo`
+        lista recursivamente (sin delimitador) todas las horas bajo el prefijo del día. Cada entrada
+        es (clave, tamaño) de un objeto .nc, tomado de la respuesta del LIST.
+        Devuelve [] si el prefijo no existe o el circuito está abierto, y None si fallaron todos los intentos.
+        """
+        last_exc = None
+        async with semaforo:
+            for attempt in range(self.retry_attempts):
+                if _s3_circuit_breaker.is_open:
+                    self.logger.warning(f"S3 circuit breaker open — omitiendo ls en {s3_path_hora}")
+                    return []
+                try:
+                    # refresh=True: la vigencia del listado la decide _ls_cacheado, no la caché interna de s3fs
+                    prefijo = _norm_prefix(s3_path_hora)
+                    if dia_completo:
+                        detalles = (await s3_client._find(prefijo, detail=True)).values()
+                    else:
+                        detalles = await s3_client._ls(prefijo, detail=True, refresh=True)
+                    _s3_circuit_breaker.record_success()
+                    # Sólo objetos NetCDF: se descartan marcadores de directorio y otros archivos
+                    # una vez aquí, antes de cachear, en lugar de en cada consulta que use el listado
+                    return [
+                        (d['name'], d.get('size') or 0) for d in detalles
+                        if d.get('type') == 'file' and d['name'].endswith('.nc')
+                    ]
+                except FileNotFoundError:
+                    return []
+                except Exception as e:
+                    _s3_circuit_breaker.record_failure()
+                    last_exc = e
+                    if attempt == self.retry_attempts - 1:
+                        break
+                    if not _s3_retry_budget.try_acquire():
+                        self.logger.warning(f"Presupuesto de reintentos S3 agotado; omitiendo ls en {s3_path_hora}")
+                        break
+                    await asyncio.sleep(_backoff_full_jitter(self.retry_backoff, attempt))
+        if last_exc:
+            self.logger.debug(f"LS S3 falló {self.retry_attempts} veces en {s3_path_hora}: {last_exc}")
+        return None
+
+    def download_files(self, consulta_id: str, archivos_s3: List[str], directorio_destino: Path, db, manifiesto: Optional[Dict[str, int]] = None) -> (List[Path], List[str]):
+        """
+        Descarga los objetos S3 pendientes a `directorio_destino`. `manifiesto` (nombre -> tamaño)
+        describe lo ya presente en el directorio; si no se da, se arma con una sola pasada de
+        os.scandir. Se completa con cada archivo recuperado sin hacer stat adicional.
+        """
+        s3 = self.s3
+        if manifiesto is None:
+            manifiesto = escanear_destino(directorio_destino)
         objetivos_aun_fallidos = []
-        s3_recuperados_set = set()
+        s3_recuperados = []
 
-        # Normalizar objetivos únicos
-        objetivos_unicos = list(set(archivos_s3))
+        # Normalizar objetivos únicos conservando el orden (una clave por objetivo: las rutas no se repiten)
+        objetivos_unicos = list(dict.fromkeys(archivos_s3))
         total_obj = len(objetivos_unicos) or 1
         update_every = settings.S3_PROGRESS_STEP
 
-        # Pre-contar archivos ya existentes para reflejar progreso real tras reinicio
+        # Pre-contar archivos ya existentes para reflejar progreso real tras reinicio:
+        # búsquedas en el manifiesto, sin stat por objetivo
         existentes = []
         pendientes = []
         for s3_path in objetivos_unicos:
-            nombre_local = Path(s3_path).name
-            ruta_local = directorio_destino / nombre_local
-            try:
-                if ruta_local.exists() and ruta_local.stat().st_size > 0:
-                    existentes.append(s3_path)
-                    s3_recuperados_set.add(ruta_local)
-                else:
-                    pendientes.append(s3_path)
-            except OSError:
+            nombre_local = _basename(s3_path)
+            if manifiesto.get(nombre_local, 0) > 0:
+                existentes.append(s3_path)
+                s3_recuperados.append(directorio_destino / nombre_local)
+            else:
                 pendientes.append(s3_path)
 
-        # Contabilizar archivos .nc presentes en el directorio para reflejar progreso real
-        try:
-            local_nc_count = sum(1 for p in directorio_destino.iterdir() if p.is_file() and str(p).endswith('.nc'))
-        except Exception:
-            local_nc_count = len(existentes)
+        # Archivos .nc presentes en el directorio, también desde el manifiesto
+        local_nc_count = sum(1 for nombre in manifiesto if nombre.endswith('.nc'))
 
         # Usar el mayor entre los que coinciden con objetivos y los .nc locales, pero sin exceder total_obj
         completados = min(max(len(existentes), local_nc_count), total_obj)
@@ -232,56 +525,69 @@ class S3RecoverFiles:
         # Si no hay pendientes, retornar de inmediato
         if not pendientes:
             self.logger.info(f"S3: no hay descargas pendientes; {completados}/{total_obj} ya presentes (consulta_id={consulta_id})")
-            return list(s3_recuperados_set), objetivos_aun_fallidos
-
-        # Timeout por tarea = S3_READ_TIMEOUT × reintentos + holgura de backoff
-        task_timeout = self.retry_attempts * (settings.S3_READ_TIMEOUT + self.retry_backoff * (2 ** self.retry_attempts)) + 10
-        with ThreadPool(max_workers=self.max_workers) as pool:
-            future_to_s3_path = {
-                pool.schedule(self._download_single_s3_objective, args=(consulta_id, s3_path, directorio_destino, s3, db)): s3_path
-                for s3_path in pendientes
-            }
-            for future in as_completed(list(future_to_s3_path.keys())):
-                s3_path = future_to_s3_path[future]
-                try:
-                    resultado = future.result()
-                    if resultado:
-                        s3_recuperados_set.add(resultado)
-                        ok_count += 1
-                except TimeoutError:
-                    self.logger.warning(
-                        f"S3 timeout ({task_timeout:.0f}s) excedido para {Path(s3_path).name} (consulta_id={consulta_id})"
+            return s3_recuperados, objetivos_aun_fallidos
+
+        progreso_s3 = ProgressThrottle(db, consulta_id, settings.progress_update_interval_seconds) if db else None
+
+        # Las descargas corren como corrutinas en el event loop de s3fs (un solo hilo multiplexa
+        # todas las conexiones); este hilo sólo espera resultados y actualiza la DB.
+        semaforo = asyncio.Semaphore(settings.S3_MAX_CONCURRENT_DOWNLOADS)
+        future_to_s3_path = {
+            asyncio.run_coroutine_threadsafe(
+                self._download_single_s3_objective(consulta_id, s3_path, directorio_destino, s3, semaforo),
+                s3.loop,
+            ): s3_path
+            for s3_path in pendientes
+        }
+        for future in as_completed(future_to_s3_path):
+            s3_path = future_to_s3_path[future]
+            try:
+                resultado = future.result()
+                if resultado:
+                    ruta, tamaño = resultado
+                    s3_recuperados.append(ruta)
+                    manifiesto[ruta.name] = tamaño
+                    ok_count += 1
+            except TimeoutError:
+                self.logger.warning(
+                    f"S3 timeout excedido para {_basename(s3_path)} (consulta_id={consulta_id})"
+                )
+                objetivos_aun_fallidos.append(_basename(s3_path))
+                fail_count += 1
+            except Exception:
+                objetivos_aun_fallidos.append(_basename(s3_path))
+                fail_count += 1
+            finally:
+                completados = min(completados + 1, total_obj)
+                if progreso_s3 and (completados % update_every == 0 or completados == total_obj):
+                    # Mapear progreso de 85 a 95 proporcional a descargas S3
+                    progreso = 85 + int((completados / total_obj) * 10)
+                    progreso_s3.actualizar(
+                        progreso,
+                        f"S3 progreso: {completados}/{total_obj}",
+                        forzar=(completados == total_obj),
                     )
-                    objetivos_aun_fallidos.append(Path(s3_path).name)
-                    fail_count += 1
-                except Exception:
-                    objetivos_aun_fallidos.append(Path(s3_path).name)
-                    fail_count += 1
-                finally:
-                    completados = min(completados + 1, total_obj)
-                    if db and (completados % update_every == 0 or completados == total_obj):
-                        # Mapear progreso de 85 a 95 proporcional a descargas S3
-                        progreso = 85 + int((completados / total_obj) * 10)
-                        db.actualizar_estado(
-                            consulta_id,
-                            "procesando",
-                            progreso,
-                            f"S3 progreso: {completados}/{total_obj}"
+                    # Log resumen cada corte
+                    try:
+                        self.logger.info(
+                            f"S3 progreso: {completados}/{total_obj} (ok: {ok_count}, fail: {fail_count}) (consulta_id={consulta_id})"
                         )
-                        # Log resumen cada corte
-                        try:
-                            self.logger.info(
-                                f"S3 progreso: {completados}/{total_obj} (ok: {ok_count}, fail: {fail_count}) (consulta_id={consulta_id})"
-                            )
-                        except Exception:
-                            pass
+                    except Exception:
+                        pass
+        if progreso_s3:
+            progreso_s3.flush()
         # Log resumen final
         self.logger.info(
             f"S3 finalizado: {ok_count} ok, {fail_count} fallos de {total_obj} objetivos (consulta_id={consulta_id})"
         )
-        return list(s3_recuperados_set), objetivos_aun_fallidos
+        return s3_recuperados, objetivos_aun_fallidos
 
-    def _download_single_s3_objective(self, consulta_id: str, archivo_remoto_s3: str, directorio_destino: Path, s3_client: s3fs.S3FileSystem, db) -> Optional[Path]:
+    async def _download_single_s3_objective(self, consulta_id: str, archivo_remoto_s3: str, directorio_destino: Path, s3_client: "s3fs.S3FileSystem", semaforo: asyncio.Semaphore) -> Optional[Tuple[Path, int]]:
+        """Descarga un objeto S3 limitando la concurrencia con `semaforo`; el tiempo límite es por intento."""
+        async with semaforo:
+            return await self._download_with_retries(consulta_id, archivo_remoto_s3, directorio_destino, s3_client)
+
+    async def _download_with_retries(self, consulta_id: str, archivo_remoto_s3: str, directorio_destino: Path, s3_client: "s3fs.S3FileSystem") -> Optional[Tuple[Path, int]]:
         last_exception = None
         for attempt in range(self.retry_attempts):
             # Fail-fast si el circuito está abierto — no bloqueamos el worker esperando timeouts
@@ -294,56 +600,58 @@ class S3RecoverFiles:
                     f"S3 circuit breaker abierto; descarga omitida: {archivo_remoto_s3}"
                 )
             try:
-                nombre_archivo_local = Path(archivo_remoto_s3).name
+                nombre_archivo_local = _basename(archivo_remoto_s3)
                 ruta_local_destino = directorio_destino / nombre_archivo_local
                 # Idempotencia: si el archivo ya existe, omitir descarga
                 try:
-                    if ruta_local_destino.exists() and ruta_local_destino.stat().st_size > 0:
-                        return ruta_local_destino
+                    tamaño = ruta_local_destino.stat().st_size
+                    if tamaño > 0:
+                        return ruta_local_destino, tamaño
                 except OSError:
                     pass
                 # Reducir ruido: no actualizar DB por cada intento/archivo; el progreso se reporta en bloque.
-                s3_client.get(archivo_remoto_s3, str(ruta_local_destino))
+                # Se descarga a un temporal y se renombra al terminar: un archivo con el nombre final y
+                # tamaño > 0 está siempre completo, así que la comprobación de arriba basta para omitirlo.
+                ruta_parcial = directorio_destino / (nombre_archivo_local + _S3_SUFIJO_PARCIAL)
+                tamaño = self._tamaños_s3.get(archivo_remoto_s3)
+                if tamaño is None:
+                    tamaño = (await s3_client._info(archivo_remoto_s3)).get('size') or 0
+                # Límite de tiempo por intento, proporcional al tamaño del objeto; al vencer, el intento
+                # se cancela (deja sólo el .part, que se borra abajo) y cuenta como un fallo más
+                tamaño = await asyncio.wait_for(
+                    _get_file_por_rangos(s3_client, archivo_remoto_s3, str(ruta_parcial), tamaño),
+                    timeout=_timeout_por_intento(tamaño),
+                )
+                os.replace(ruta_parcial, ruta_local_destino)
                 _s3_circuit_breaker.record_success()
-                return ruta_local_destino
+                return ruta_local_destino, tamaño
             except Exception as e:
                 _s3_circuit_breaker.record_failure()
+                (directorio_destino / (_basename(archivo_remoto_s3) + _S3_SUFIJO_PARCIAL)).unlink(missing_ok=True)
                 last_exception = e
                 # Reducir ruido: registrar intentos a nivel debug
                 self.logger.debug(f"Intento {attempt + 1}/{self.retry_attempts} falló para {archivo_remoto_s3} (consulta_id={consulta_id}): {e}")
                 if attempt < self.retry_attempts - 1:
-                    wait_time = self.retry_backoff * (2 ** attempt)
-                    time.sleep(wait_time)
+                    if not _s3_retry_budget.try_acquire():
+                        self.logger.warning(f"Presupuesto de reintentos S3 agotado; sin reintentar {archivo_remoto_s3} (consulta_id={consulta_id})")
+                        break
+                    await asyncio.sleep(_backoff_full_jitter(self.retry_backoff, attempt))
         self.logger.error(f"❌ Fallaron todos los {self.retry_attempts} intentos para descargar desde S3 el archivo {archivo_remoto_s3} (consulta_id={consulta_id}).")
         if last_exception:
             raise last_exception
         return None
 
     def filter_files_by_time(self, archivos_nc: list, fecha_jjj: str, horarios_list: list) -> list:
+        inicios, fines = _ventanas_fusionadas(tuple(horarios_list))
         archivos_filtrados = []
         for archivo in archivos_nc:
             nombre = archivo.name if hasattr(archivo, "name") else archivo
-            s_idx = nombre.find('_s')
-            e_idx = nombre.find('_e')
-            if s_idx == -1 or e_idx == -1:
+            match = _S3_TIMESTAMP_RE.search(nombre)
+            if not match or match[1] != fecha_jjj:
                 continue
-            ts_str = nombre[s_idx+2:e_idx]
-            if len(ts_str) < 11:
-                continue
-            anio = ts_str[:4]
-            dia_juliano = ts_str[4:7]
-            hora = ts_str[7:9]
-            minuto = ts_str[9:11]
-            if anio + dia_juliano != fecha_jjj:
-                continue
-            archivo_hm = int(hora) * 60 + int(minuto)
-            for horario_str in horarios_list:
-                partes = horario_str.split('-')
-                inicio = partes[0]
-                fin = partes[1] if len(partes) > 1 else inicio
-                inicio_hm = int(inicio[:2]) * 60 + int(inicio[3:5])
-                fin_hm = int(fin[:2]) * 60 + int(fin[3:5])
-                if inicio_hm <= archivo_hm <= fin_hm:
-                    archivos_filtrados.append(archivo)
-                    break
+            archivo_hm = int(match[2]) * 60 + int(match[3])
+            # Última ventana que empieza en o antes del minuto del archivo: es la única que puede contenerlo
+            i = bisect_right(inicios, archivo_hm) - 1
+            if i >= 0 and archivo_hm <= fines[i]:
+                archivos_filtrados.append(archivo)
         return archivos_filtrados
@@ -15,6 +15,9 @@ class Settings(BaseSettings):
     s3_fallback_enabled: bool = Field(True, description="Enable/disable fallback to S3.")
     lustre_enabled: bool = Field(True, description="Enable/disable the use of Lustre.")
     file_processing_timeout_seconds: int = Field(120, description="Maximum processing time per file in seconds.")
+    disk_bandwidth_mb_s: float = Field(800.0, gt=0.0, description="Effective write bandwidth in MB/s of the download disk, used to size concurrent extractions.")
+    extract_task_mb_s: float = Field(100.0, gt=0.0, description="Approximate write bandwidth in MB/s consumed by a single .tgz extraction.")
+    progress_update_interval_seconds: float = Field(0.5, ge=0.0, description="Minimum seconds between per-file progress writes to the database.")
     sim_local_success_rate: float = Field(0.8, ge=0.0, le=1.0, description="Local success rate in simulator mode.")
     sim_s3_success_rate: float = Field(0.5, ge=0.0, le=1.0, description="S3 success rate in simulator mode.")
     max_files_per_query: int = Field(0, description="Maximum estimated files per query (0 = no limit).")
@@ -31,8 +34,10 @@ class Settings(BaseSettings):
     # S3 Specific Settings
     S3_RETRY_ATTEMPTS: int = Field(3, description="Number of retry attempts for S3 operations.")
     S3_RETRY_BACKOFF_SECONDS: float = Field(1.0, description="Backoff factor for S3 retries in seconds.")
+    S3_RETRY_MAX_BACKOFF_SECONDS: float = Field(20.0, ge=0.0, description="Upper bound in seconds for a single jittered S3 retry wait.")
     S3_CONNECT_TIMEOUT: int = Field(5, description="S3 connection timeout in seconds.")
     S3_READ_TIMEOUT: int = Field(30, description="S3 read timeout in seconds.")
+    S3_MAX_CONCURRENT_DOWNLOADS: int = Field(32, ge=1, description="Maximum concurrent S3 downloads in flight on the async event loop.")
     S3_PROGRESS_STEP: int = Field(100, description="Update progress every N files for S3 downloads.")
 
     model_config = ConfigDict(env_file=".env", env_file_encoding='utf-8')
@@ -0,0 +1,118 @@
+"""
+Tests unitarios para ProgressThrottle (limitador de escrituras de progreso en la DB).
+"""
+import pytest
+
+import database
+from database import ProgressThrottle
+
+
+class _DBFalsa:
+    def __init__(self):
+        self.escrituras = []
+
+    def actualizar_estado(self, consulta_id, estado, progreso=None, mensaje=None):
+        self.escrituras.append((consulta_id, estado, progreso, mensaje))
+
+
+@pytest.fixture
+def db():
+    return _DBFalsa()
+
+
+def test_first_update_is_written(db):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    assert throttle.actualizar(20, "inicio")
+    assert db.escrituras == [("c1", "procesando", 20, "inicio")]
+
+
+def test_updates_within_interval_are_skipped(db):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    assert not throttle.actualizar(21, "b")
+    assert not throttle.actualizar(22, "c")
+    assert len(db.escrituras) == 1
+
+
+def test_same_percentage_is_skipped_even_after_interval(db):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=0)
+    throttle.actualizar(20, "a")
+    assert not throttle.actualizar(20, "b")
+    assert throttle.actualizar(21, "c")
+    assert [e[2] for e in db.escrituras] == [20, 21]
+
+
+def test_forced_update_always_written(db):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    assert throttle.actualizar(80, "fin", forzar=True)
+    assert db.escrituras[-1][2:] == (80, "fin")
+
+
+def test_flush_writes_last_skipped_state_once(db):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    throttle.actualizar(30, "b")
+    throttle.actualizar(40, "c")
+    throttle.flush()
+    throttle.flush()
+    assert [e[2:] for e in db.escrituras] == [(20, "a"), (40, "c")]
+
+
+
+class _TimerFalso:
+    """Sustituto de threading.Timer: registra la función y sólo la ejecuta al llamar a disparar()."""
+    creados = []
+
+    def __init__(self, intervalo, funcion):
+        self.intervalo = intervalo
+        self.funcion = funcion
+        self.cancelado = False
+        self.daemon = False
+        _TimerFalso.creados.append(self)
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelado = True
+
+    def disparar(self):
+        if not self.cancelado:
+            self.funcion()
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    _TimerFalso.creados = []
+    monkeypatch.setattr(database.threading, "Timer", _TimerFalso)
+    return _TimerFalso.creados
+
+
+def test_timer_publishes_skipped_state_without_new_updates(db, timers):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    throttle.actualizar(30, "b")
+    throttle.actualizar(40, "c")
+    assert len(timers) == 1
+    timers[0].disparar()
+    assert [e[2:] for e in db.escrituras] == [(20, "a"), (40, "c")]
+
+
+def test_same_percentage_does_not_arm_timer(db, timers):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    throttle.actualizar(20, "b")
+    assert timers == []
+    throttle.flush()
+    assert [e[2:] for e in db.escrituras] == [(20, "a"), (20, "b")]
+
+
+def test_flush_cancels_pending_timer(db, timers):
+    throttle = ProgressThrottle(db, "c1", intervalo_s=60)
+    throttle.actualizar(20, "a")
+    throttle.actualizar(30, "b")
+    throttle.flush()
+    assert timers[0].cancelado
+    timers[0].disparar()
+    assert [e[2] for e in db.escrituras] == [20, 30]
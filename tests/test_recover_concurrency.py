@@ -0,0 +1,102 @@
+"""
+Tests unitarios para la concurrencia de recover: plazo de las copias, compuerta de extracción
+e hilo escritor de miembros.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from recover import _EscritorMiembros, _programar_con_compuerta, _resultados_con_plazo
+
+
+def _futuro(resultado=None, error=None) -> Future:
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(resultado)
+    return future
+
+
+def test_stuck_copy_times_out_pending_files():
+    cola = queue.Queue()
+    vencido = threading.Event()
+    cola.put((_futuro("a"), "a.tgz"))  # "b.tgz" y "c.tgz" nunca llegan: copia atascada
+
+    inicio = time.monotonic()
+    resultados = list(_resultados_con_plazo(cola, ["a.tgz", "b.tgz", "c.tgz"], 0.1, vencido))
+
+    assert time.monotonic() - inicio < 2
+    assert vencido.is_set()
+    assert [archivo for _, archivo in resultados] == ["a.tgz", "b.tgz", "c.tgz"]
+    assert resultados[0][0].result() == "a"
+    for future, _ in resultados[1:]:
+        with pytest.raises(TimeoutError):
+            future.result()
+
+
+def test_results_within_deadline_do_not_expire():
+    cola = queue.Queue()
+    vencido = threading.Event()
+    for archivo in ("a.tgz", "b.tgz"):
+        cola.put((_futuro(archivo), archivo))
+
+    resultados = list(_resultados_con_plazo(cola, ["a.tgz", "b.tgz"], 0.1, vencido))
+
+    assert not vencido.is_set()
+    assert [future.result() for future, _ in resultados] == ["a.tgz", "b.tgz"]
+
+
+def test_gate_is_released_when_programar_fails():
+    compuerta = threading.BoundedSemaphore(1)
+
+    def programar(objetivo):
+        if objetivo == "malo":
+            raise RuntimeError("pool cerrado")
+        return _futuro(objetivo)
+
+    resultados = dict((o, f) for f, o in _programar_con_compuerta(compuerta, programar, ["malo", "x", "y"]))
+
+    with pytest.raises(RuntimeError):
+        resultados["malo"].result()
+    assert resultados["x"].result() == "x" and resultados["y"].result() == "y"
+    assert compuerta.acquire(blocking=False)  # la compuerta quedó libre
+
+
+def test_gate_is_released_when_task_fails():
+    compuerta = threading.BoundedSemaphore(1)
+    objetivos = ["lento", "x"]
+
+    def programar(objetivo):
+        if objetivo == "lento":
+            return _futuro(error=TimeoutError("tarea vencida"))
+        return _futuro(objetivo)
+
+    resultados = dict((o, f) for f, o in _programar_con_compuerta(compuerta, programar, objetivos))
+
+    with pytest.raises(TimeoutError):
+        resultados["lento"].result()
+    assert resultados["x"].result() == "x"
+    assert compuerta.acquire(blocking=False)
+
+
+def test_writer_error_is_raised_on_exit(tmp_path):
+    ruta = str(tmp_path / "no_es_directorio" / "miembro.nc")
+    (tmp_path / "no_es_directorio").write_text("")  # un archivo donde debería ir el directorio
+
+    with pytest.raises(OSError):
+        with _EscritorMiembros() as escritor:
+            escritor.abrir(ruta)
+
+
+def test_writer_error_does_not_mask_caller_exception(tmp_path):
+    ruta = str(tmp_path / "no_es_directorio" / "miembro.nc")
+    (tmp_path / "no_es_directorio").write_text("")
+
+    with pytest.raises(ValueError):
+        with _EscritorMiembros() as escritor:
+            escritor.abrir(ruta)
+            raise ValueError("falla del productor")
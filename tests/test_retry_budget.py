@@ -0,0 +1,76 @@
+"""
+Tests unitarios para S3RetryBudget y su exposición en /health.
+"""
+import time
+import threading
+import pytest
+
+from s3_recover import S3RetryBudget
+
+
+@pytest.fixture
+def budget():
+    """Presupuesto fresco para cada prueba (no comparte estado con el singleton)."""
+    return S3RetryBudget(rate=10.0, burst=3)
+
+
+def test_initial_budget_is_full(budget):
+    assert budget.tokens == pytest.approx(3.0, abs=0.05)
+
+
+def test_acquire_consumes_tokens_until_exhausted(budget):
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+
+def test_tokens_refill_over_time(budget):
+    for _ in range(3):
+        budget.try_acquire()
+    assert not budget.try_acquire()
+
+    # 10 tokens/s → tras 0.15 s hay al menos un token disponible
+    time.sleep(0.15)
+    assert budget.try_acquire()
+
+
+def test_refill_never_exceeds_burst(budget):
+    time.sleep(0.5)
+    assert budget.tokens <= budget.burst
+
+
+def test_concurrent_acquire_never_overspends():
+    budget = S3RetryBudget(rate=0.0, burst=50)
+    concedidos = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            if budget.try_acquire():
+                with lock:
+                    concedidos.append(1)
+
+    hilos = [threading.Thread(target=worker) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert len(concedidos) == 50
+
+
+# ---------------------------------------------------------------------------
+# /health expone el presupuesto de reintentos
+# ---------------------------------------------------------------------------
+
+def test_health_includes_retry_budget_field(monkeypatch, tmp_path):
+    import asyncio
+    import main
+
+    monkeypatch.setattr(main, "SOURCE_DATA_PATH", str(tmp_path))
+    data = asyncio.run(main.health_check_detailed())
+    assert "s3_retry_budget" in data
+    info = data["s3_retry_budget"]
+    assert set(info) == {"tokens", "rate_per_s", "burst"}
+    assert 0 <= info["tokens"] <= info["burst"]
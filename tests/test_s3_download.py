@@ -0,0 +1,65 @@
+"""
+Tests unitarios para la descarga S3 a disco: GET por rangos y manifiesto del directorio destino.
+"""
+import asyncio
+
+import pytest
+
+import s3_recover
+from s3_recover import _get_file_por_rangos
+
+_PARTE = 1024
+_TAMAÑO = 8 * _PARTE
+
+
+class _ClienteFalso:
+    """Cliente S3 mínimo: sirve rangos de bytes deterministas; la parte 0 puede fallar."""
+
+    def __init__(self, falla_parte_0=False):
+        self.falla_parte_0 = falla_parte_0
+        self.rangos_servidos = []
+
+    async def _cat_file(self, ruta, start, end):
+        if start == 0 and self.falla_parte_0:
+            raise IOError("fallo simulado")
+        await asyncio.sleep(0.05)
+        self.rangos_servidos.append(start)
+        return bytes((i % 251 for i in range(start, end)))
+
+
+@pytest.fixture(autouse=True)
+def partes_pequeñas(monkeypatch):
+    monkeypatch.setattr(s3_recover, "_S3_RANGE_THRESHOLD_BYTES", 2 * _PARTE)
+    monkeypatch.setattr(s3_recover, "_S3_RANGE_PART_BYTES", _PARTE)
+
+
+def test_ranged_download_writes_every_part(tmp_path):
+    destino = tmp_path / "obj.nc"
+    tamaño = asyncio.run(_get_file_por_rangos(_ClienteFalso(), "b/obj.nc", str(destino), _TAMAÑO))
+    assert tamaño == _TAMAÑO
+    assert destino.read_bytes() == bytes(i % 251 for i in range(_TAMAÑO))
+
+
+def test_failing_part_stops_siblings_before_fd_is_closed(tmp_path):
+    cliente = _ClienteFalso(falla_parte_0=True)
+    otro = tmp_path / "otro.bin"
+
+    async def _escenario():
+        with pytest.raises(IOError):
+            await _get_file_por_rangos(cliente, "b/obj.nc", str(tmp_path / "obj.nc"), _TAMAÑO)
+        # Un archivo abierto justo después suele reutilizar el número de fd de la descarga
+        with open(otro, "wb") as f:
+            f.write(b"0123456789")
+            f.flush()
+            await asyncio.sleep(0.2)
+
+    asyncio.run(_escenario())
+    assert cliente.rangos_servidos == []
+    assert otro.read_bytes() == b"0123456789"
+
+
+def test_destination_manifest_ignores_partial_downloads(tmp_path):
+    (tmp_path / "a.nc").write_bytes(b"12345")
+    (tmp_path / "b.nc.part").write_bytes(b"123")
+    assert s3_recover.escanear_destino(tmp_path) == {"a.nc": 5}
+    assert s3_recover.escanear_destino(tmp_path / "no_existe") == {}
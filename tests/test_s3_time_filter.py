@@ -0,0 +1,32 @@
+"""
+Tests unitarios para el filtro horario de S3 (ventanas fusionadas + búsqueda binaria).
+"""
+import logging
+
+import pytest
+
+from s3_recover import S3RecoverFiles, _ventanas_fusionadas
+
+
+def _nombre(fecha_jjj: str, hhmm: str) -> str:
+    return f"noaa-goes16/ABI-L1b-RadF/x/OR_ABI-L1b-RadF-M6C13_G16_s{fecha_jjj}{hhmm}000_e1_c1.nc"
+
+
+@pytest.fixture
+def s3():
+    return S3RecoverFiles(logging.getLogger(__name__), max_workers=2)
+
+
+def test_overlapping_windows_are_merged():
+    assert _ventanas_fusionadas(("10:31", "10:00-10:25", "10:20-10:40", "12:00")) == ((600, 720), (640, 720))
+
+
+def test_filter_keeps_files_inside_any_window(s3):
+    archivos = [_nombre("2021001", hhmm) for hhmm in ("0959", "1000", "1015", "1030", "1031", "1200")]
+    filtrados = s3.filter_files_by_time(archivos, "2021001", ["10:00-10:15", "10:31"])
+    assert filtrados == [archivos[1], archivos[2], archivos[4]]
+
+
+def test_filter_rejects_other_dates_and_unparseable_names(s3):
+    archivos = [_nombre("2021002", "1000"), "noaa-goes16/ABI-L1b-RadF/x/index.html"]
+    assert s3.filter_files_by_time(archivos, "2021001", ["00:00-23:59"]) == []